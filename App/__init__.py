@@ -1,14 +1,21 @@
 import os
+import time
+
+_import_started = time.perf_counter()
 
 from flask import Flask, redirect, url_for, session,g
 from .dashboardbp import dashboardbp
 from .endpoints import chart_bp
 from .auth import authbp
-from .database import init_db
+from .database import record_startup_timing, log_startup_timings, warm_up
+from .manage_db import add_indexes_command, migrate_unified_command, rebuild_rollups_command
+
+record_startup_timing('imports', time.perf_counter() - _import_started)
 
 
 def create_app(test_config=None):
     # create and configure the appcle
+    started = time.perf_counter()
     DB = os.getenv("DATABASE_NAME")
     USER = os.getenv("USER_NAME")
     HOST = os.getenv("HOST")
@@ -17,20 +24,24 @@ def create_app(test_config=None):
     connection_string = f"mysql+mysqldb://{USER}:{PASSWORD}@{HOST}:3306/{DB}"
     app.config.from_mapping(
         SECRET_KEY='dev',
-        SQLALCHEMY_DATABASE_URI = connection_string
+        SQLALCHEMY_DATABASE_URI = connection_string,
+        # Connect and verify the schema at startup instead of on first request
+        DB_WARM_UP = os.getenv("DB_WARM_UP", "").lower() in ("1", "true", "yes")
     )
     @app.before_request
     def load_user():
         g.user_id = session.get('user_id')
         g.username = session.get('username')
 
-    init_db()
     @app.route('/')
     def index():
         return redirect(url_for('auth.login'))
     app.register_blueprint(authbp)
     app.register_blueprint(dashboardbp)
     app.register_blueprint(chart_bp)
+    app.cli.add_command(add_indexes_command)
+    app.cli.add_command(migrate_unified_command)
+    app.cli.add_command(rebuild_rollups_command)
     
 
     if test_config is None:
@@ -46,4 +57,9 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    if app.config.get('DB_WARM_UP'):
+        warm_up()
+    record_startup_timing('create_app', time.perf_counter() - started)
+    log_startup_timings("app created")
+
     return app
\ No newline at end of file
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+import time
+
+from .cache import TTLCache, RedisCache, MISSING
+from . import user_stats
+
+# Cache for per-user aggregates: dashboard totals, chart aggregates and the first
+# transactions page. Entries live in an in-process LRU and, when CACHE_REDIS_URL
+# is set, in Redis as well so every worker shares them.
+#
+# Keys carry the user's data version from user_stats, the same one their ETags
+# are built from, so a cached body is always served under the version it was
+# computed for. An upload moves the version and older entries are never read
+# again; they simply age out. A worker whose stats cache has not seen the upload
+# yet keeps serving the previous version under the previous ETag.
+AGGREGATE_CACHE_TTL = int(os.getenv("AGGREGATE_CACHE_TTL", "300"))
+AGGREGATE_CACHE_SIZE = int(os.getenv("AGGREGATE_CACHE_SIZE", "5000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# The user_id IS NULL sample data is what every user without uploads sees, so its
+# aggregates are kept in memory without expiry, each computed by one request at a
+# time. After SAMPLE_REFRESH_INTERVAL seconds one request recomputes them while
+# the others keep getting the previous copy.
+SAMPLE_REFRESH_INTERVAL = int(os.getenv("SAMPLE_REFRESH_INTERVAL", "3600"))
+
+_local = TTLCache(ttl=AGGREGATE_CACHE_TTL, maxsize=AGGREGATE_CACHE_SIZE)
+_shared = None
+_sample = TTLCache(ttl=0, maxsize=256)
+# One lock per sample key being computed, so different aggregates compute in parallel
+_sample_locks = {}
+_sample_locks_guard = threading.Lock()
+
+if CACHE_REDIS_URL:
+    try:
+        _shared = RedisCache(CACHE_REDIS_URL, ttl=AGGREGATE_CACHE_TTL, prefix='dash:agg:')
+    except Exception as e:
+        print(f"Warning: shared aggregate cache disabled. Error: {e}")
+
+def cached(kind, user_id, key, compute):
+    """
+    Value of compute() for (kind, user_id, key), from the cache when possible.
+    compute() returning None means the value could not be computed; it is passed
+    through and not cached. Cached values are shared, so callers must not mutate them.
+    """
+    if user_id is None:
+        return _cached_sample(f"{kind}:{key!r}", compute)
+
+    version = user_stats.user_version(user_id)
+    if version is None:
+        # No stats record to version the value by
+        return compute()
+    cache_key = f"{kind}:{user_id}:{version}:{key!r}"
+    value = _local.get(cache_key)
+    if value is not MISSING:
+        return value
+    if _shared is not None:
+        value = _shared.get(cache_key)
+        if value is not MISSING:
+            _local.set(cache_key, value)
+            return value
+
+    value = compute()
+    if value is not None:
+        _local.set(cache_key, value)
+        if _shared is not None:
+            _shared.set(cache_key, value)
+    return value
+
+def _acquire_sample_lock(cache_key, blocking):
+    """Take cache_key's compute lock. Returns it, or None if blocking is False and it is busy."""
+    with _sample_locks_guard:
+        lock, users = _sample_locks.get(cache_key, (None, 0))
+        if lock is None:
+            lock = threading.Lock()
+        # Counted before acquiring so the entry outlives everyone waiting on it
+        _sample_locks[cache_key] = (lock, users + 1)
+    if lock.acquire(blocking=blocking):
+        return lock
+    _release_sample_lock(cache_key, None)
+    return None
+
+def _release_sample_lock(cache_key, lock):
+    with _sample_locks_guard:
+        entry_lock, users = _sample_locks[cache_key]
+        if users == 1:
+            del _sample_locks[cache_key]
+        else:
+            _sample_locks[cache_key] = (entry_lock, users - 1)
+    if lock is not None:
+        lock.release()
+
+def _cached_sample(cache_key, compute):
+    entry = _sample.get(cache_key)
+    if entry is not MISSING:
+        value, computed_at, _ = entry
+        if time.monotonic() - computed_at < SAMPLE_REFRESH_INTERVAL:
+            return value
+        # Stale: one request refreshes it, the rest serve the old copy meanwhile
+        lock = _acquire_sample_lock(cache_key, blocking=False)
+        if lock is None:
+            return value
+    else:
+        # Nothing yet: the first request computes, concurrent ones for the same key wait for it
+        lock = _acquire_sample_lock(cache_key, blocking=True)
+
+    try:
+        entry = _sample.get(cache_key)
+        if entry is not MISSING and time.monotonic() - entry[1] < SAMPLE_REFRESH_INTERVAL:
+            return entry[0]
+        value = compute()
+        if value is not None:
+            digest = hashlib.sha1(repr(value).encode()).hexdigest()[:16]
+            _sample.set(cache_key, (value, time.monotonic(), digest))
+        elif entry is not MISSING:
+            # Keep serving the previous copy if the refresh failed
+            value = entry[0]
+        return value
+    finally:
+        _release_sample_lock(cache_key, lock)
+
+def sample_version(*keys):
+    """
+    Digest of the cached sample values for the given (kind, key) pairs, or None if
+    any is missing or due for a refresh. Identical data gives the same digest in
+    every process, so it can seed HTTP validators.
+    """
+    digests = []
+    for kind, key in keys:
+        entry = _sample.get(f"{kind}:{key!r}")
+        if entry is MISSING or time.monotonic() - entry[1] >= SAMPLE_REFRESH_INTERVAL:
+            return None
+        digests.append(entry[2])
+    return ".".join(digests)
+
+def invalidate(user_id):
+    """
+    Forget the cached sample aggregates when user_id is None. Per-user entries
+    are keyed on the user's data version and need no invalidation.
+    """
+    if user_id is None:
+        _sample.clear()
+
+def clear():
+    """Drop this process's cached aggregates."""
+    _local.clear()
+    _sample.clear()
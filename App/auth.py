@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from .database import get_db, engine,init_db
+from .database import get_db
 from .user_model import Base, User
 from sqlalchemy.exc import IntegrityError
 
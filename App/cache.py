@@ -0,0 +1,90 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# redis is optional: only needed when a shared cache backend is configured
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Returned by get() when a key is absent or expired, so falsy values can be cached
+MISSING = object()
+
+class TTLCache:
+    """Thread-safe in-process cache with per-entry expiry and LRU eviction."""
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """
+    Shared cache backend with the TTLCache interface, for values that every web
+    worker should see. Values are pickled; keys are namespaced with prefix.
+    Connection errors are treated as cache misses.
+    """
+    def __init__(self, url, ttl=60, prefix='dash:'):
+        if redis is None:
+            raise RuntimeError("the redis package is required for a shared cache backend")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key, default=MISSING):
+        try:
+            raw = self._client.get(self._key(key))
+        except redis.RedisError:
+            return default
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self._client.set(self._key(key), pickle.dumps(value), ex=ttl or None)
+        except redis.RedisError:
+            pass
+
+    def delete(self, key):
+        try:
+            self._client.delete(self._key(key))
+        except redis.RedisError:
+            pass
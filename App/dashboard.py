@@ -1,48 +1,12 @@
-import os
-import pymysql
-from collections import defaultdict
-from sqlalchemy import create_engine, text, func, inspect, Table, MetaData
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-
-metadata = MetaData()
-
-# Database configuration from environment variables
-DB = os.getenv("DATABASE_NAME")
-USER = os.getenv("USER_NAME")
-HOST = os.getenv("HOST")
-PASSWORD = os.getenv("PASSWORD")
-
-# Connect to MySQL
-pymysql.install_as_MySQLdb() 
-connection_string = f"mysql+pymysql://{USER}:{PASSWORD}@{HOST}/{DB}"
-engine = create_engine(connection_string, pool_pre_ping=True, echo=False)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-
-# Session Manager
-class SessionManager:
-    """Simple context manager to mimic the imported Session()"""
-    def __enter__(self):
-        self.session = SessionLocal()
-        return self.session
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.session.close()
-
-Session = SessionManager 
-
-# List all your transaction tables (sanitized names)
-TRANSACTION_TABLES = [
-    'bank_transfers',
-    'withdrawals_from_agents',
-    'transactions_initiated_by_third_parties',
-    'bundle_purchases',
-    'cash_power_bill_payments',
-    'airtime_bill_payments',
-    'bank_deposits',
-    'transfers_to_mobile_numbers',
-    'payments_to_code_holders',
-    'incoming_money'
-]
+from sqlalchemy import func, select, literal, union_all, extract
+
+# Shared engine and session factory, created lazily on first use
+from .database import get_db
+from . import user_stats, aggregate_cache, schema_cache
+from .parser import CATEGORIES
+from .storage import TRANSACTION_TABLES, ROLLUP_TABLE, transaction_sources, user_filter
+
+Session = get_db
 
 # ----------------------------------------------------------------------
 ## Helper Function for User ID Determination
@@ -53,11 +17,12 @@ def has_user_transactions(user_id):
         return False
     
     with Session() as session:
-        for table_name in TRANSACTION_TABLES:
+        for table, _, conditions in transaction_sources(columns=("user_id",)):
             try:
-                query_str = f"SELECT 1 FROM {table_name} WHERE user_id = :user_id LIMIT 1"
-                query = text(query_str)
-                result = session.execute(query, {"user_id": user_id}).fetchone()
+                query = select(literal(1)).select_from(table).where(
+                    table.c.user_id == user_id, *conditions
+                ).limit(1)
+                result = session.execute(query).first()
                 
                 if result:
                     return True
@@ -73,8 +38,21 @@ def get_user_id_for_query(logged_in_user_id):
     if logged_in_user_id is None:
         return None
     
-    # Check if the logged-in user has any data uploaded
-    if has_user_transactions(logged_in_user_id):
+    # Check if the logged-in user has any data uploaded, using the cached per-user index
+    try:
+        stats = user_stats.get_user_stats(logged_in_user_id)
+        if stats is None:
+            # Data uploaded before the index existed: probe the tables once and record it
+            row_count = 0
+            if has_user_transactions(logged_in_user_id):
+                row_count = get_dashboard_totals(logged_in_user_id)["total_transactions"]
+            stats = user_stats.backfill_user_stats(logged_in_user_id, row_count)
+        has_data = bool(stats and stats["has_data"])
+    except Exception as e:
+        print(f"Warning: user stats lookup failed, probing tables. Error: {e}")
+        has_data = has_user_transactions(logged_in_user_id)
+
+    if has_data:
         return logged_in_user_id # User has data, fetch their data
     else:
         return None # User has no data, return None to trigger sample data query
@@ -82,201 +60,241 @@ def get_user_id_for_query(logged_in_user_id):
 # ----------------------------------------------------------------------
 ## Data Fetching Functions
 
-def fetch_transactions(user_id=None):
+def transaction_union(user_id, *columns):
     """
-    Fetch transactions. If user_id is None, it fetches records where user_id IS NULL (sample data).
+    Subquery stacking the given columns of every transaction source with UNION ALL
+    (or reading the unified table directly), restricted to user_id. A 'category'
+    column names each row's category table. Returns None when no source has the
+    requested columns.
     """
-    all_data = {}
-    with SessionLocal() as session:
-        for table in TRANSACTION_TABLES:
-            
-            query_str = f"SELECT date, amount FROM {table}"
-            params = {}
-            conditions = []
-            
-            try:
-                # Use 'autoload_with=engine' to inspect the table for column presence
-                table_meta = Table(table, metadata, autoload_with=engine)
-            except Exception:
-                all_data[table] = []
-                continue
+    selects = []
+    for table, category, conditions in transaction_sources(columns=columns):
+        stmt = select(category.label("category"), *[table.c[column] for column in columns])
+        condition = user_filter(table, user_id)
+        if condition is not None:
+            conditions = conditions + [condition]
+        if conditions:
+            stmt = stmt.where(*conditions)
+        selects.append(stmt)
+
+    if not selects:
+        return None
+    if len(selects) == 1:
+        return selects[0].subquery("transactions")
+    return union_all(*selects).subquery("transactions")
 
-            # --- Query Logic ---
-            if "user_id" in [c.name for c in table_meta.columns]:
-                if user_id is not None:
-                    conditions.append("user_id = :user_id")
-                    params["user_id"] = user_id
-                else:
-                    conditions.append("user_id IS NULL")
-            # -------------------
-            
-            if conditions:
-                 query_str += " WHERE " + " AND ".join(conditions)
-            
-            query = text(query_str)
-            try:
-                result = session.execute(query, params).fetchall()
-                transactions = [{'date': row[0], 'amount': row[1]} for row in result if row[1] is not None]
-                all_data[table] = transactions
-            except Exception as e:
-                # print(f"Warning: Could not query table {table}. Error: {e}")
-                all_data[table] = []
-                
-    return all_data
+# Rollup categories are table names; the dashboard shows the parser's tra_type
+TRA_TYPE_NAMES = {category.lower(): category for category in CATEGORIES}
 
-def get_total_transactions(user_id=None):
-    """Count transactions. If user_id is None, it counts records where user_id IS NULL."""
-    total = 0
-    inspector = inspect(engine)
-    try:
-        tables = inspector.get_table_names()
-    except Exception:
-        return 0
+def fetch_rollups(user_id):
+    """
+    user_id's rows from the rollup table, or None when they cannot stand in for the
+    raw tables: sample data, no rollup table yet, or rollups that do not add up to
+    the row count recorded for the user (data from before rollups existed, or an
+    upload still in progress). `flask --app App rebuild-rollups` brings old data in.
+    """
+    if user_id is None:
+        return None
+    table = schema_cache.get_table(ROLLUP_TABLE)
+    if table is None:
+        return None
+    stats = user_stats.get_user_stats(user_id)
+    if not stats:
+        return None
 
+    query = select(
+        table.c.category, table.c.month, table.c.row_count, table.c.amount_count, table.c.amount_total,
+    ).where(table.c.user_id == user_id)
     with Session() as session:
-        for table_name in tables:
-            try:
-                table = Table(table_name, metadata, autoload_with=engine)
-            except Exception:
-                continue
+        try:
+            rows = session.execute(query).all()
+        except Exception as e:
+            print(f"Warning: could not read rollups, using the raw tables. Error: {e}")
+            return None
 
-            query = session.query(func.count()).select_from(table)
+    if sum(row.row_count for row in rows) != stats["row_count"]:
+        return None
+    return rows
 
-            if "user_id" in [c.name for c in table.columns]:
-                if user_id is not None:
-                    query = query.filter(table.c.user_id == user_id)
-                else:
-                    query = query.filter(table.c.user_id.is_(None))
+def _empty_totals():
+    return {
+        "total_amount": 0.0,
+        "total_transactions": 0,
+        "type_counts": {},
+        "most_used": None,
+    }
 
-            try:
-                count = query.scalar() or 0
-                total += count
-            except Exception:
-                continue
-                
-    return total
+def get_dashboard_totals(user_id=None):
+    """
+    Total amount, total count and per-type counts for user_id (None means the
+    user_id IS NULL sample data). Read from the user's rollups when they are
+    complete, otherwise computed with one aggregate query over a UNION ALL of
+    the transaction tables. Results are cached until the user's next upload.
+    """
+    totals = aggregate_cache.cached("totals", user_id, (), lambda: _compute_dashboard_totals(user_id))
+    return totals if totals is not None else _empty_totals()
+
+def _compute_dashboard_totals(user_id):
+    """Uncached get_dashboard_totals(); None if the query failed."""
+    totals = _empty_totals()
+    rollups = fetch_rollups(user_id)
+    if rollups is not None:
+        for row in rollups:
+            tra_type = TRA_TYPE_NAMES.get(row.category, row.category)
+            totals["type_counts"][tra_type] = totals["type_counts"].get(tra_type, 0) + row.row_count
+            totals["total_transactions"] += row.row_count
+            totals["total_amount"] += row.amount_total or 0.0
+        return _with_most_used(totals)
 
-def get_total_amount(user_id=None):
-    """Sum amounts. If user_id is None, it sums records where user_id IS NULL."""
-    total_amount = 0.0
-    inspector = inspect(engine)
     try:
-        tables = inspector.get_table_names()
-    except Exception:
-        return 0.0
-
-    with Session() as session:
-        for table_name in tables:
-            try:
-                table = Table(table_name, metadata, autoload_with=engine)
-            except Exception:
-                continue
+        source = transaction_union(user_id, "tra_type", "amount")
+    except Exception as e:
+        print(f"Warning: could not build the dashboard query. Error: {e}")
+        return None
+    if source is None:
+        return totals
 
-            if "amount" in [c.name for c in table.columns]:
-                query = session.query(func.sum(table.c.amount))
+    query = select(
+        source.c.tra_type,
+        func.count().label("count"),
+        func.sum(source.c.amount).label("amount"),
+    ).group_by(source.c.tra_type)
 
-                if "user_id" in [c.name for c in table.columns]:
-                    if user_id is not None:
-                        query = query.filter(table.c.user_id == user_id)
-                    else:
-                        query = query.filter(table.c.user_id.is_(None))
+    with Session() as session:
+        try:
+            rows = session.execute(query).all()
+        except Exception as e:
+            print(f"Warning: could not compute dashboard totals. Error: {e}")
+            return None
+
+    for tra_type, count, amount in rows:
+        totals["type_counts"][tra_type] = count
+        totals["total_transactions"] += count
+        totals["total_amount"] += amount or 0.0
+    return _with_most_used(totals)
+
+def _with_most_used(totals):
+    if totals["type_counts"]:
+        most_used = max(totals["type_counts"].items(), key=lambda x: x[1])
+        totals["most_used"] = {"transaction_type": most_used[0], "count": most_used[1]}
+    return totals
 
-                try:
-                    amount_sum = query.scalar() or 0.0
-                    total_amount += amount_sum
-                except Exception:
-                    continue
+def get_total_transactions(user_id=None):
+    """Count transactions. If user_id is None, it counts records where user_id IS NULL."""
+    return get_dashboard_totals(user_id)["total_transactions"]
 
-    return total_amount
+def get_total_amount(user_id=None):
+    """Sum amounts. If user_id is None, it sums records where user_id IS NULL."""
+    return get_dashboard_totals(user_id)["total_amount"]
 
 def get_most_used_transaction_type(user_id=None):
     """Find the most used transaction type. If user_id is None, considers transactions where user_id IS NULL."""
-    inspector = inspect(engine)
-    try:
-        tables = inspector.get_table_names()
-    except Exception:
-        return None
-    
-    type_counts = {}
+    return get_dashboard_totals(user_id)["most_used"]
 
-    with Session() as session:
-        for table_name in tables:
-            try:
-                table = Table(table_name, metadata, autoload_with=engine)
-            except Exception:
+def fetch_chart_aggregates(user_id=None):
+    """
+    Chart data for user_id, from the user's rollups when they are complete or
+    else aggregated in SQL: one GROUP BY (category, year, month) over the UNION
+    ALL of the transaction tables. Only rows with an amount are counted, as
+    before. Cached until the user's next upload. Returns:
+        {'by_type': {category: {'count': n, 'amount': total}},
+         'monthly': {'YYYY-MM': n}}
+    """
+    aggregates = aggregate_cache.cached("charts", user_id, (), lambda: _compute_chart_aggregates(user_id))
+    return aggregates if aggregates is not None else {"by_type": {}, "monthly": {}}
+
+def _compute_chart_aggregates(user_id):
+    """Uncached fetch_chart_aggregates(); None if the query failed."""
+    aggregates = {"by_type": {}, "monthly": {}}
+    rollups = fetch_rollups(user_id)
+    if rollups is not None:
+        for row in rollups:
+            if not row.amount_count:
                 continue
+            by_type = aggregates["by_type"].setdefault(row.category, {"count": 0, "amount": 0.0})
+            by_type["count"] += row.amount_count
+            by_type["amount"] += row.amount_total or 0.0
+            if row.month:
+                aggregates["monthly"][row.month] = aggregates["monthly"].get(row.month, 0) + row.amount_count
+        return aggregates
 
-            if "tra_type" in [c.name for c in table.columns] and "user_id" in [c.name for c in table.columns]:
-                query = session.query(
-                    table.c.tra_type,
-                    func.count().label("count")
-                )
-
-                if user_id is not None:
-                    query = query.filter(table.c.user_id == user_id)
-                else:
-                    query = query.filter(table.c.user_id.is_(None))
-
-                query = query.group_by(table.c.tra_type)
-
-                try:
-                    counts = query.all()
-                    for tra_type, count in counts:
-                        type_counts[tra_type] = type_counts.get(tra_type, 0) + count
-                except Exception:
-                    continue
-
-    if not type_counts:
+    try:
+        source = transaction_union(user_id, "date", "amount")
+    except Exception as e:
+        print(f"Warning: could not build the chart query. Error: {e}")
         return None
+    if source is None:
+        return aggregates
+
+    year = extract("year", source.c.date)
+    month = extract("month", source.c.date)
+    query = (
+        select(source.c.category, year, month, func.count(), func.sum(source.c.amount))
+        .where(source.c.amount.isnot(None))
+        .group_by(source.c.category, year, month)
+    )
 
-    most_used = max(type_counts.items(), key=lambda x: x[1])
-    return {"transaction_type": most_used[0], "count": most_used[1]}
+    with Session() as session:
+        try:
+            rows = session.execute(query).all()
+        except Exception as e:
+            print(f"Warning: could not compute chart aggregates. Error: {e}")
+            return None
+
+    for category, year_value, month_value, count, amount in rows:
+        by_type = aggregates["by_type"].setdefault(category, {"count": 0, "amount": 0.0})
+        by_type["count"] += count
+        by_type["amount"] += amount or 0.0
+        if year_value is not None and month_value is not None:
+            month_str = f"{int(year_value):04d}-{int(month_value):02d}"
+            aggregates["monthly"][month_str] = aggregates["monthly"].get(month_str, 0) + count
+    return aggregates
+
+def warm_sample_aggregates():
+    """Compute the sample-data (user_id IS NULL) aggregates ahead of the first new user."""
+    from .details import fetch_tra_page
+    get_dashboard_totals(None)
+    fetch_chart_aggregates(None)
+    fetch_tra_page(None)
 
 # ----------------------------------------------------------------------
 ## Chart Helper Functions
 
-def get_transaction_volume_by_type(all_data):
+def _type_count(aggregates, table):
+    return aggregates["by_type"].get(table, {}).get("count", 0)
+
+def _type_amount(aggregates, table):
+    return aggregates["by_type"].get(table, {}).get("amount", 0)
+
+def get_transaction_volume_by_type(aggregates):
     labels = TRANSACTION_TABLES
-    data = [len(all_data[t]) for t in labels]
+    data = [_type_count(aggregates, t) for t in labels]
     return labels, data
 
-def get_transaction_amount_by_type(all_data):
+def get_transaction_amount_by_type(aggregates):
     labels = TRANSACTION_TABLES
-    data = [sum(txn['amount'] for txn in all_data[t] if txn.get('amount') is not None) for t in labels]
+    data = [_type_amount(aggregates, t) for t in labels]
     return labels, data
 
-def get_monthly_transaction_trends(all_data):
-    monthly_counter = defaultdict(int)
-    for txns in all_data.values():
-        for txn in txns:
-            if txn['date']:
-                date_obj = txn['date']
-                if not isinstance(date_obj, datetime):
-                    try:
-                        date_obj = datetime.strptime(str(date_obj).split(' ')[0], '%Y-%m-%d')
-                    except:
-                        continue 
-                
-                month_str = date_obj.strftime('%Y-%m')
-                monthly_counter[month_str] += 1
-                
+def get_monthly_transaction_trends(aggregates):
+    monthly_counter = aggregates["monthly"]
     labels = sorted(monthly_counter.keys())
     data = [monthly_counter[m] for m in labels]
     return labels, data
 
-def get_transaction_distribution(all_data):
+def get_transaction_distribution(aggregates):
     labels = TRANSACTION_TABLES
-    volume_data = [len(all_data[t]) for t in labels]
+    volume_data = [_type_count(aggregates, t) for t in labels]
     total_txns = sum(volume_data)
     data = [(v / total_txns * 100 if total_txns else 0) for v in volume_data]
     return labels, data
 
-def get_average_transaction_amount(all_data):
+def get_average_transaction_amount(aggregates):
     labels = TRANSACTION_TABLES
     data = []
     for t in labels:
-        amounts = [txn['amount'] for txn in all_data[t] if txn.get('amount') is not None]
-        data.append(sum(amounts)/len(amounts) if amounts else 0)
+        count = _type_count(aggregates, t)
+        data.append(_type_amount(aggregates, t) / count if count else 0)
     return labels, data
 
 if __name__ == "__main__":
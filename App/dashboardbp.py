@@ -1,12 +1,15 @@
-from flask import Blueprint, render_template, request, g, url_for, flash, redirect
+import csv
+import io
+import json
+from flask import Blueprint, Response, render_template, request, g, url_for, flash, redirect, jsonify, stream_with_context
 from .middleware import login_required
-from .details import fetch_filtered_tra_details, fetch_tra_details
-from .parser import parser
-from .manage_db import inserting_in_database
+from .details import (
+    fetch_tra_page, iter_transactions_by_date, parse_amount,
+    EXPORT_COLUMNS, PAGE_SIZE, STREAM_YIELD_PER,
+)
+from .jobs import submit_upload, job_status, describe_job
 from .dashboard import (
-    get_most_used_transaction_type,
-    get_total_amount,
-    get_total_transactions,
+    get_dashboard_totals,
     get_user_id_for_query, # <-- Now imported from dashboard.py
 )
 
@@ -21,15 +24,21 @@ def dashboard():
     # Use the shared logic
     user_id_to_query = get_user_id_for_query(logged_in_user_id)
     
-    total = get_total_amount(user_id=user_id_to_query)
-    tran = get_total_transactions(user_id=user_id_to_query)
-    type_data = get_most_used_transaction_type(user_id=user_id_to_query) 
+    # One aggregate query instead of one query per table per figure
+    totals = get_dashboard_totals(user_id=user_id_to_query)
+    total = totals['total_amount']
+    tran = totals['total_transactions']
+    type_data = totals['most_used']
     
     most = type_data['transaction_type'] if type_data else "N/A"
     
     return render_template('dashboard.html', total=total, tran=tran, most=most)
 
 
+def serialize_transaction(row):
+    """JSON-friendly copy of a transaction row."""
+    return {**row, 'date': row['date'].isoformat() if row['date'] else None}
+
 @dashboardbp.route('/api/transactions', methods=['GET', 'POST'])
 @login_required 
 def transaction():
@@ -37,21 +46,100 @@ def transaction():
     # Use the shared logic
     user_id_to_query = get_user_id_for_query(logged_in_user_id)
 
+    filters = {}
     if request.method == 'POST':
-        start_date = request.form.get('startdate')
-        end_date = request.form.get('enddate')
-        transaction_type = request.form.get('filterbytype')
+        filters = {
+            'startdate': request.form.get('startdate') or '',
+            'enddate': request.form.get('enddate') or '',
+            'filterbytype': request.form.get('filterbytype') or '',
+            'minamount': request.form.get('minamount') or '',
+            'maxamount': request.form.get('maxamount') or '',
+        }
+
+    # Only the first page is rendered; the page fetches the rest on demand
+    rows, next_cursor = fetch_tra_page(
+        user_id=user_id_to_query,
+        start_date=filters.get('startdate'),
+        end_date=filters.get('enddate'),
+        transaction_type=filters.get('filterbytype'),
+        min_amount=parse_amount(filters.get('minamount')),
+        max_amount=parse_amount(filters.get('maxamount'))
+    )
+    
+    return render_template('transactions.html', rows=rows, next_cursor=next_cursor, filters=filters)
 
-        data = fetch_filtered_tra_details(
+@dashboardbp.route('/api/transactions/page')
+@login_required
+def transaction_page():
+    """Keyset-paginated transactions as JSON: ?cursor=&limit=&startdate=&enddate=&filterbytype=&minamount=&maxamount="""
+    user_id_to_query = get_user_id_for_query(g.user_id)
+    try:
+        rows, next_cursor = fetch_tra_page(
             user_id=user_id_to_query,
-            start_date=start_date,
-            end_date=end_date,
-            transaction_type=transaction_type
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', PAGE_SIZE, type=int),
+            start_date=request.args.get('startdate'),
+            end_date=request.args.get('enddate'),
+            transaction_type=request.args.get('filterbytype'),
+            min_amount=parse_amount(request.args.get('minamount')),
+            max_amount=parse_amount(request.args.get('maxamount'))
         )
-    else:
-        data = fetch_tra_details(user_id=user_id_to_query)
-    
-    return render_template('transactions.html', data=data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'rows': [serialize_transaction(row) for row in rows], 'next_cursor': next_cursor})
+
+def _csv_export(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('category',) + EXPORT_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row['category']] + [
+            row['date'].isoformat() if column == 'date' and row['date'] else row[column]
+            for column in EXPORT_COLUMNS
+        ])
+        if count % STREAM_YIELD_PER == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _ndjson_export(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(serialize_transaction(row)) + '\n')
+        if len(lines) >= STREAM_YIELD_PER:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+EXPORT_FORMATS = {
+    'csv': (_csv_export, 'text/csv'),
+    'ndjson': (_ndjson_export, 'application/x-ndjson'),
+}
+
+@dashboardbp.route('/api/transactions/export')
+@login_required
+def export_transactions():
+    """Stream all (filtered) transactions, newest first: ?format=csv|ndjson plus the listing filters"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format '{export_format}', use csv or ndjson"}), 400
+    writer, mimetype = EXPORT_FORMATS[export_format]
+
+    user_id_to_query = get_user_id_for_query(g.user_id)
+    rows = iter_transactions_by_date(
+        user_id=user_id_to_query,
+        start_date=request.args.get('startdate') or None,
+        end_date=request.args.get('enddate') or None,
+        transaction_type=request.args.get('filterbytype') or None,
+        min_amount=parse_amount(request.args.get('minamount')),
+        max_amount=parse_amount(request.args.get('maxamount'))
+    )
+    return Response(
+        stream_with_context(writer(rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=transactions.{export_format}'},
+    )
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = ['xml']
@@ -60,7 +148,7 @@ def allowed_file(filename):
 @dashboardbp.route('/upload', methods=['POST'])
 @login_required 
 def upload_file():
-    """Handle file uploads, parse data, and insert into the database."""
+    """Handle file uploads: spool the file and queue it for background ingestion."""
     if 'file' not in request.files:
         flash('No file part')
         return redirect(url_for('dashboard.dashboard'))
@@ -74,11 +162,15 @@ def upload_file():
     if file and allowed_file(file.filename):
         try:
             user_id = g.user_id
-            # Assuming parser and inserting_in_database are correctly imported/defined elsewhere
-            parsed_data = parser(file)
-            inserting_in_database(parsed_data, user_id)
-            
-            flash('File uploaded and data processed successfully!')
+            # Parsing and inserting happen on an ingest worker; poll the status URL
+            job_id = submit_upload(file, user_id)
+            status_url = url_for('dashboard.upload_status', job_id=job_id)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'job_id': job_id, 'status_url': status_url}), 202
+
+            # With inline ingest (INGEST_WORKERS=0, serverless) the job has finished by now and
+            # this reports what was imported; with a background pool it says the job is queued
+            flash(describe_job(job_status(job_id, user_id)))
             return redirect(url_for('dashboard.dashboard'))
         except Exception as e:
             flash(f'An error occurred: {e}')
@@ -87,6 +179,15 @@ def upload_file():
         flash('Invalid file type. Only XML files are allowed.')
         return redirect(url_for('dashboard.dashboard'))
 
+@dashboardbp.route('/upload/status/<job_id>')
+@login_required
+def upload_status(job_id):
+    """Progress of an upload job: status, parsed and inserted counts."""
+    status = job_status(job_id, g.user_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
 @dashboardbp.route('/api/visuals')
 @login_required
 def visuals():
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine 
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
 import os
+import threading
+import time
 
 
 DB = os.getenv("DATABASE_NAME")
@@ -9,20 +13,170 @@ USER = os.getenv("USER_NAME")
 HOST = os.getenv("HOST")
 PASSWORD = os.getenv("PASSWORD")
 
+# Pool tuning, shared by every module through the single engine below
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
 import pymysql
 pymysql.install_as_MySQLdb()
 
 connection_string = f"mysql+mysqldb://{USER}:{PASSWORD}@{HOST}:3306/{DB}"
-engine = create_engine(connection_string)
-Session = sessionmaker(bind=engine)
+
+# ---
+## Pool statistics
+
+_stats_lock = threading.Lock()
+_pool_stats = {
+    'connects': 0,
+    'checkouts': 0,
+    'checkins': 0,
+    'timeouts': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+}
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _pool_stats[key] += amount
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            _bump('timeouts')
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with _stats_lock:
+                _pool_stats['wait_total'] += waited
+                _pool_stats['wait_max'] = max(_pool_stats['wait_max'], waited)
+
+def pool_stats():
+    """Snapshot of checkout/wait counters plus the live pool status."""
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    stats['wait_avg'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    pool = get_engine().pool
+    stats['status'] = pool.status()
+    if isinstance(pool, QueuePool):
+        stats['size'] = pool.size()
+        stats['checked_out'] = pool.checkedout()
+        stats['overflow'] = pool.overflow()
+    return stats
+
+# ---
+## Engine factory
+
+def create_db_engine(url=connection_string):
+    """Build the application engine with the configured connection pool."""
+    db_engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_recycle=POOL_RECYCLE,
+        pool_timeout=POOL_TIMEOUT,
+        pool_pre_ping=True,
+        echo=False,
+    )
+    event.listen(db_engine, 'connect', lambda *args: _bump('connects'))
+    event.listen(db_engine, 'checkout', lambda *args: _bump('checkouts'))
+    event.listen(db_engine, 'checkin', lambda *args: _bump('checkins'))
+    return db_engine
+
+# ---
+## Lazy engine and startup timings
+# Nothing connects at import time: the engine is built on first use and the
+# schema is verified on the first session, unless warm_up() did it already.
+
+_engine = None
+_engine_lock = threading.Lock()
+_schema_ready = False
+_startup_timings = {}
+
+Session = sessionmaker(autoflush=False)
 Base = declarative_base()
-def init_db():
-    from .user_model import User
+
+def record_startup_timing(phase, seconds):
+    _startup_timings[phase] = _startup_timings.get(phase, 0.0) + seconds
+
+def startup_timings():
+    """Seconds spent per startup phase (engine, connect, schema, ...) in this process."""
+    return dict(_startup_timings)
+
+def log_startup_timings(stage):
+    # print, like the rest of the app's reporting: Flask's logger drops INFO unless configured
+    print(f"Startup timings ({stage}): " + ", ".join(
+        f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in startup_timings().items()
+    ))
+
+def get_engine():
+    """Return the shared engine, creating it on first call."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                started = time.perf_counter()
+                db_engine = create_db_engine()
+                Session.configure(bind=db_engine)
+                _engine = db_engine
+                record_startup_timing('engine', time.perf_counter() - started)
+    return _engine
+
+def _connect_and_create_schema():
+    global _schema_ready
+    engine = get_engine()
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    record_startup_timing('connect', time.perf_counter() - started)
+
+    # create_all is idempotent, so a race between two threads here is harmless
+    started = time.perf_counter()
+    from .user_model import User, UserDataStats, IngestJob
     Base.metadata.create_all(engine)
+    _schema_ready = True
+    record_startup_timing('schema', time.perf_counter() - started)
+
+def init_db():
+    """Create the application tables once per process."""
+    if _schema_ready:
+        return
+    _connect_and_create_schema()
+    # Without DB_WARM_UP this runs on the first request, after create_app() logged its
+    # timings, so report the engine, connect and schema phases now
+    log_startup_timings("first database use")
+
+def warm_up():
+    """
+    Pay the connection, schema and sample-aggregate costs up front. Meant for long-running
+    deployments (gunicorn) where the first request should not absorb them.
+    """
+    if not _schema_ready:
+        _connect_and_create_schema()
+
+    started = time.perf_counter()
+    from .manage_db import ensure_category_tables
+    ensure_category_tables()
+    record_startup_timing('category_tables', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    from .dashboard import warm_sample_aggregates
+    warm_sample_aggregates()
+    record_startup_timing('sample_aggregates', time.perf_counter() - started)
+    return startup_timings()
+
 @contextmanager
 def get_db():
+    get_engine()
+    init_db()
     session = Session()
     try:
         yield session
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
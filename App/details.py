@@ -1,131 +1,305 @@
+import base64
+import difflib
+import heapq
+import json
 import os
-import pymysql
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import re
+from itertools import islice
+from sqlalchemy import select, union_all, and_, or_
 from datetime import datetime 
 
-DB = os.getenv("DATABASE_NAME")
-USER = os.getenv("USER_NAME")
-HOST = os.getenv("HOST")
-PASSWORD = os.getenv("PASSWORD")
-
-try:
-    connection_string = f"mysql+pymysql://{USER}:{PASSWORD}@{HOST}/{DB}"
-    engine = create_engine(connection_string, pool_pre_ping=True, echo=False)
-    with engine.connect() as connection:
-        connection.execute(text("SELECT 1"))
-    print("Database connection successful.")
-except Exception as e:
-    print(f"Error connecting to database: {e}")
-    engine = None 
-
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-
-TRANSACTION_TABLES = [
-    'bank_transfers',
-    'withdrawals_from_agents',
-    'transactions_initiated_by_third_parties',
-    'bundle_purchases',
-    'cash_power_bill_payments',
-    'airtime_bill_payments',
-    'bank_deposits',
-    'transfers_to_mobile_numbers',
-    'payments_to_code_holders',
-    'incoming_money'
-]
+from .database import get_db
+from .storage import TRANSACTION_TABLES, transaction_sources, user_filter
+from . import aggregate_cache
+
+# Rows per page of the transactions listing, and the most a client may ask for
+PAGE_SIZE = int(os.getenv("TRANSACTIONS_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+# Rows fetched per round trip when streaming full listings with a server-side cursor
+STREAM_YIELD_PER = int(os.getenv("STREAM_YIELD_PER", "500"))
+# Rows each table hands the recent-activity merge per query
+MERGE_BATCH_SIZE = int(os.getenv("MERGE_BATCH_SIZE", "50"))
 
 # ---
 ## fetch_tra_details (UPDATED LOGIC)
 
-def fetch_tra_details(user_id=None):
-    if not engine:
-        return {}
-        
-    all_data = {}
-    with SessionLocal() as session:
-        for table in TRANSACTION_TABLES:
-            query_str = f"SELECT amount, date, tra_type FROM {table}"
-            params = {}
-            conditions = []
-
-            if user_id is not None:
-                conditions.append("user_id = :user_id")
-                params['user_id'] = user_id
-            else: 
-                conditions.append("user_id IS NULL")
-            
-            if conditions:
-                query_str += " WHERE " + " AND ".join(conditions)
-            
-            query_str += " ORDER BY date DESC"
-
-            try:
-                query = text(query_str)
-                result = session.execute(query, params).fetchall()
-                
-                transactions = [
-                    {'amount': row[0], 'date': row[1], 'tra_type': row[2]}
-                    for row in result
-                ]
-                all_data[table] = transactions
-            except Exception as e:
-                print(f"Error fetching data from table {table}: {e}")
-                all_data[table] = [] 
+def _detail_conditions(table, user_id, start_date=None, end_date=None, min_amount=None, max_amount=None):
+    conditions = []
+    condition = user_filter(table, user_id)
+    if condition is not None:
+        conditions.append(condition)
+    if start_date:
+        conditions.append(table.c.date >= start_date)
+    if end_date:
+        conditions.append(table.c.date <= end_date)
+    if min_amount is not None:
+        conditions.append(table.c.amount >= min_amount)
+    if max_amount is not None:
+        conditions.append(table.c.amount <= max_amount)
+    return conditions
+
+def _stream_category(session, category_name, user_id, start_date=None, end_date=None, min_amount=None, max_amount=None):
+    """
+    Transactions of one category, newest first, read with a server-side cursor
+    STREAM_YIELD_PER rows at a time. Errors end the stream early (after printing)
+    since rows may already have been sent.
+    """
+    for table, category, conditions in transaction_sources([category_name], ("amount", "date", "tra_type")):
+        query = (
+            select(table.c.amount, table.c.date, table.c.tra_type)
+            .where(*conditions, *_detail_conditions(table, user_id, start_date, end_date, min_amount, max_amount))
+            .order_by(table.c.date.desc())
+            .execution_options(stream_results=True, yield_per=STREAM_YIELD_PER)
+        )
+        try:
+            for row in session.execute(query):
+                yield {'amount': row[0], 'date': row[1], 'tra_type': row[2]}
+        except Exception as e:
+            print(f"Error fetching data from table {table.name}: {e}")
+
+def iter_tra_details(user_id=None, categories=None, start_date=None, end_date=None, min_amount=None, max_amount=None):
+    """
+    Yields (category, rows) for every category in name order, where rows is an
+    iterator streaming that category's transactions. Each rows iterator must be
+    consumed before moving on; nothing is buffered beyond one fetch batch.
+    """
+    categories = sorted(TRANSACTION_TABLES if categories is None else categories)
+    with get_db() as session:
+        for category in categories:
+            yield category, _stream_category(session, category, user_id, start_date, end_date, min_amount, max_amount)
+
+def _fetch_grouped(categories, user_id, start_date=None, end_date=None, min_amount=None, max_amount=None):
+    """{category: [transactions newest first]} read through the storage layer."""
+    all_data = {category: [] for category in categories}
+    for category, rows in iter_tra_details(user_id, categories, start_date, end_date, min_amount, max_amount):
+        all_data[category].extend(rows)
     return all_data
 
+def fetch_tra_details(user_id=None):
+    return _fetch_grouped(TRANSACTION_TABLES, user_id)
+
+# ---
+## Filter planning
+# A type filter is resolved to the category tables it names before any query is
+# built, so only those tables are read; every other predicate goes into SQL.
+
+# Words that do not help tell categories apart ("Transfers to Mobile Numbers")
+_FILLER_WORDS = {'and', 'to', 'from', 'by', 'of', 'the', 'for', 'on'}
+_CATEGORY_WORDS = {table: [word for word in table.split('_') if word not in _FILLER_WORDS] for table in TRANSACTION_TABLES}
+_VOCABULARY = sorted({word for words in _CATEGORY_WORDS.values() for word in words})
+
+def _type_tokens(transaction_type):
+    words = re.split(r'[^a-z0-9]+', transaction_type.lower())
+    return [word for word in words if word and word not in _FILLER_WORDS]
+
+def _prefix_matches(tokens):
+    """Tables where every token starts one of the table's words ('bank' -> both bank tables)."""
+    return [
+        table for table, words in _CATEGORY_WORDS.items()
+        if all(any(word.startswith(token) for word in words) for token in tokens)
+    ]
+
+def resolve_categories(transaction_type):
+    """
+    Category tables a free-text type filter refers to, trying in turn:
+      1. the exact table name ('Incoming Money' -> incoming_money)
+      2. partial words ('bank' -> bank_transfers, bank_deposits)
+      3. tables all of whose words appear in the filter
+         ('Internet and Voice Bundle Purchases' -> bundle_purchases)
+      4. the above after correcting typos against the category vocabulary
+    No filter means every table; an unrecognised filter means none.
+    """
+    if not transaction_type or not transaction_type.strip():
+        return list(TRANSACTION_TABLES)
+
+    name = re.sub(r'[^a-z0-9]+', '_', transaction_type.lower()).strip('_')
+    if name in TRANSACTION_TABLES:
+        return [name]
+    tokens = _type_tokens(transaction_type)
+    if not tokens:
+        return []
+
+    matches = _prefix_matches(tokens)
+    if matches:
+        return matches
+    matches = [table for table, words in _CATEGORY_WORDS.items() if set(words) <= set(tokens)]
+    if matches:
+        return matches
+
+    corrected = []
+    for token in tokens:
+        close = difflib.get_close_matches(token, _VOCABULARY, n=1, cutoff=0.75)
+        if close:
+            corrected.append(close[0])
+    if not corrected:
+        return []
+    return _prefix_matches(corrected) or [
+        table for table, words in _CATEGORY_WORDS.items() if set(words) <= set(corrected)
+    ]
+
+def parse_amount(value):
+    """Amount bound from a form/query value ('1,000' or '1000 RWF'); None if blank or invalid."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    cleaned = str(value).replace(',', '').replace('RWF', '').strip()
+    try:
+        return float(cleaned) if cleaned else None
+    except ValueError:
+        return None
+
 # ---
 ## fetch_filtered_tra_details (UPDATED LOGIC)
 
-def fetch_filtered_tra_details(user_id=None, start_date=None, end_date=None, transaction_type=None):
-    if not engine:
-        return {}
-        
-    all_data = {}
-    with SessionLocal() as session:
-        for table in TRANSACTION_TABLES:
-            query_str = f"SELECT amount, date, tra_type FROM {table}"
-            params = {}
-            conditions = []
-
-            if user_id is not None:
-                conditions.append("user_id = :user_id")
-                params['user_id'] = user_id
-            else:
-                conditions.append("user_id IS NULL")
-
-            if start_date:
-                conditions.append("date >= :start_date")
-                params['start_date'] = start_date
-
-            if end_date:
-                conditions.append("date <= :end_date")
-                params['end_date'] = end_date
-
-            if transaction_type and transaction_type.lower().replace(' ', '_') == table:
-                conditions.append("tra_type = :tra_type")
-                params['tra_type'] = transaction_type.replace(' ', '_')
-
-            if conditions:
-                query_str += " WHERE " + " AND ".join(conditions)
-
-            query_str += " ORDER BY date DESC"
-
-            query = text(query_str)
-            try:
-                result = session.execute(query, params).fetchall()
-
-                transactions = [
-                    {'amount': row[0], 'date': row[1], 'tra_type': row[2]}
-                    for row in result
-                ]
-
-                if not transaction_type or (transaction_type and transaction_type.lower().replace(' ', '_') == table):
-                    all_data[table] = transactions
-            except Exception as e:
-                print(f"Error fetching filtered data from table {table}: {e}")
-                all_data[table] = []
+def fetch_filtered_tra_details(user_id=None, start_date=None, end_date=None, transaction_type=None,
+                               min_amount=None, max_amount=None):
+    categories = resolve_categories(transaction_type)
+    return _fetch_grouped(categories, user_id, start_date, end_date, min_amount, max_amount)
+
+# ---
+## iter_transactions_by_date (exports)
+
+# Columns written by exports, after 'category'
+EXPORT_COLUMNS = (
+    'id', 'date', 'tra_type', 'amount', 'fee', 'new_balance', 'transaction_id',
+    'sender_name', 'sender_number', 'receiver_name', 'receiver_number',
+    'agent_number', 'third_party_name',
+)
+
+def iter_transactions_by_date(user_id=None, start_date=None, end_date=None, transaction_type=None,
+                              min_amount=None, max_amount=None):
+    """
+    Every matching transaction across the category tables (or the unified table),
+    newest first, as dicts of 'category' plus EXPORT_COLUMNS. One UNION ALL query
+    ordered by (date, id) is read through a server-side cursor, so memory does not
+    depend on the number of rows. Takes the same filters as fetch_filtered_tra_details.
+    """
+    categories = resolve_categories(transaction_type)
+    selects = []
+    for table, category, conditions in transaction_sources(categories, EXPORT_COLUMNS):
+        selects.append(
+            select(category.label('category'), *[table.c[column] for column in EXPORT_COLUMNS])
+            .where(*conditions, *_detail_conditions(table, user_id, start_date, end_date, min_amount, max_amount))
+        )
+    if not selects:
+        return
+
+    merged = union_all(*selects).subquery() if len(selects) > 1 else selects[0].subquery()
+    query = (
+        select(merged)
+        .order_by(merged.c.date.desc(), merged.c.id.desc())
+        .execution_options(stream_results=True, yield_per=STREAM_YIELD_PER)
+    )
+    with get_db() as session:
+        for row in session.execute(query):
+            yield dict(row._mapping)
+
+# ---
+## fetch_tra_page (keyset pagination)
+
+def encode_cursor(date, row_id):
+    """Opaque token for the (date, id) position of the last row on a page."""
+    raw = json.dumps([date.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Raises ValueError on a malformed token."""
+    try:
+        date_str, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return datetime.fromisoformat(date_str), str(row_id)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {token!r}") from e
+
+def fetch_tra_page(user_id=None, cursor=None, limit=PAGE_SIZE, start_date=None, end_date=None, transaction_type=None,
+                   min_amount=None, max_amount=None):
+    """
+    One page of transactions, newest first, merged across the category tables
+    (or read from the unified table).
+
+    Pages are keyed on (date, id) and read through iter_recent_transactions(),
+    which only pulls the rows the page needs from each source, so the cost of a
+    page does not depend on how deep into the history it is. Rows without a date
+    cannot be positioned and are left out.
+
+    The first page is cached per user and filter set until the next upload.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        page = _query_tra_page(user_id, decode_cursor(cursor), limit, start_date, end_date, transaction_type,
+                               min_amount, max_amount)
+    else:
+        page = aggregate_cache.cached(
+            "first_page", user_id,
+            (limit, start_date or None, end_date or None, transaction_type or None, min_amount, max_amount),
+            lambda: _query_tra_page(user_id, None, limit, start_date, end_date, transaction_type,
+                                    min_amount, max_amount),
+        )
+    return page if page is not None else ([], None)
+
+def _query_tra_page(user_id, after, limit, start_date, end_date, transaction_type, min_amount=None, max_amount=None):
+    """One page after the decoded cursor position `after`; None if the query failed."""
+    stream = iter_recent_transactions(user_id, after, min(limit + 1, MERGE_BATCH_SIZE),
+                                      start_date, end_date, transaction_type, min_amount, max_amount)
+    try:
+        result = list(islice(stream, limit + 1))
+    except Exception as e:
+        print(f"Error fetching transactions page: {e}")
+        return None
+    finally:
+        stream.close()
+
+    rows = result[:limit]
+    next_cursor = None
+    if len(result) > limit:
+        next_cursor = encode_cursor(rows[-1]['date'], rows[-1]['id'])
+    return rows, next_cursor
+
+# ---
+## iter_recent_transactions (heap merge)
+
+def _keyset_before(table, after):
+    after_date, after_id = after
+    return or_(
+        table.c.date < after_date,
+        and_(table.c.date == after_date, table.c.id < after_id),
+    )
+
+def _iter_source_desc(session, table, category, conditions, batch_size, after=None):
+    """One source's rows newest first, fetched lazily in (date, id) keyset batches."""
+    while True:
+        query = (
+            select(category.label('category'), table.c.id, table.c.date, table.c.amount, table.c.tra_type)
+            .where(*conditions, *([_keyset_before(table, after)] if after else []))
+            .order_by(table.c.date.desc(), table.c.id.desc())
+            .limit(batch_size)
+        )
+        rows = session.execute(query).all()
+        for row in rows:
+            yield {'id': row.id, 'category': row.category, 'amount': row.amount, 'date': row.date, 'tra_type': row.tra_type}
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].date, rows[-1].id)
+
+def iter_recent_transactions(user_id=None, after=None, batch_size=MERGE_BATCH_SIZE,
+                             start_date=None, end_date=None, transaction_type=None, min_amount=None, max_amount=None):
+    """
+    Transactions newest first across all sources, merged with a heap over one
+    lazily batched cursor per category table. Only the rows actually consumed
+    (plus at most one batch per table) are read. Rows without a date are left
+    out. Query errors propagate to the caller.
+    """
+    categories = resolve_categories(transaction_type)
+    with get_db() as session:
+        streams = []
+        for table, category, conditions in transaction_sources(categories, ("id", "date", "amount", "tra_type")):
+            conditions = conditions + [table.c.date.isnot(None)]
+            conditions += _detail_conditions(table, user_id, start_date, end_date, min_amount, max_amount)
+            streams.append(_iter_source_desc(session, table, category, conditions, batch_size, after))
+        yield from heapq.merge(*streams, key=lambda row: (row['date'], row['id']), reverse=True)
 
-    return all_data
 if __name__ == "__main__":
     # NOTE: This will now attempt to fetch data where user_id IS NULL
     print("--- Fetching Sample Data (user_id=None, expects user_id IS NULL) ---")
@@ -1,9 +1,9 @@
-from flask import Blueprint, jsonify, g
-from .middleware import login_required
-from .details import fetch_tra_details
+from flask import Blueprint, Response, jsonify, g, current_app, stream_with_context
+from .middleware import login_required, data_versioned
+from .details import iter_tra_details, STREAM_YIELD_PER
 
 from .dashboard import (
-    fetch_transactions,
+    fetch_chart_aggregates,
     get_average_transaction_amount,
     get_transaction_distribution,
     get_monthly_transaction_trends,
@@ -16,47 +16,92 @@ chart_bp = Blueprint('chart',__name__, url_prefix='/charts')
 
 @chart_bp.route('/api/monthly_trends')
 @login_required
+@data_versioned
 def monthly_trends():
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    all_data = fetch_transactions(user_id=user_id_to_query)
-    labels, data = get_monthly_transaction_trends(all_data)
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    labels, data = get_monthly_transaction_trends(aggregates)
     return jsonify({'labels':labels,'data':data})
 
 @chart_bp.route('/api/volume_type')
 @login_required
+@data_versioned
 def volume_type():
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    all_data = fetch_transactions(user_id=user_id_to_query)
-    labels, data = get_transaction_volume_by_type(all_data)
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    labels, data = get_transaction_volume_by_type(aggregates)
     return jsonify({'labels':labels,'data':data})
 
 @chart_bp.route('/api/amount_type')
 @login_required
+@data_versioned
 def amount_type():
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    all_data = fetch_transactions(user_id=user_id_to_query)
-    labels, data = get_transaction_amount_by_type(all_data)
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    labels, data = get_transaction_amount_by_type(aggregates)
     return jsonify({'labels':labels,'data':data})
 
 @chart_bp.route('/api/transaction_amount')
 @login_required
+@data_versioned
 def transaction_amount():
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    all_data = fetch_transactions(user_id=user_id_to_query)
-    labels, data = get_average_transaction_amount(all_data)
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    labels, data = get_average_transaction_amount(aggregates)
     return jsonify({'labels':labels,'data':data})
 
 @chart_bp.route('/api/transaction_distribution')
 @login_required
+@data_versioned
 def transaction_destribution():
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    all_data = fetch_transactions(user_id=user_id_to_query)
-    labels, data = get_transaction_distribution(all_data)
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    labels, data = get_transaction_distribution(aggregates)
     return jsonify({'labels':labels,'data':data})
 
+@chart_bp.route('/api/summary')
+@login_required
+@data_versioned
+def summary():
+    """All five chart series from a single aggregate pass, in one payload."""
+    user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
+    aggregates = fetch_chart_aggregates(user_id=user_id_to_query)
+    payload = {}
+    for name, helper in (
+        ('monthly_trends', get_monthly_transaction_trends),
+        ('transaction_distribution', get_transaction_distribution),
+        ('volume_type', get_transaction_volume_by_type),
+        ('amount_type', get_transaction_amount_by_type),
+        ('transaction_amount', get_average_transaction_amount),
+    ):
+        labels, data = helper(aggregates)
+        payload[name] = {'labels':labels,'data':data}
+    return jsonify(payload)
+
 @chart_bp.route('/api/details')
 @login_required
+@data_versioned
 def details():
+    """Every transaction grouped by category, streamed as JSON while it is read."""
     user_id_to_query = get_user_id_for_query(g.user_id) # Use shared logic
-    data = fetch_tra_details(user_id=user_id_to_query)
-    return jsonify(data)
\ No newline at end of file
+    json = current_app.json
+
+    def dumps(value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def generate():
+        # Same document jsonify() would build, written out category by category
+        yield '{'
+        for index, (category, rows) in enumerate(iter_tra_details(user_id=user_id_to_query)):
+            chunk = [(',' if index else '') + dumps(category) + ':[']
+            for position, row in enumerate(rows):
+                chunk.append((',' if position else '') + dumps(row))
+                # Send rows in batches rather than one tiny write each
+                if len(chunk) >= STREAM_YIELD_PER:
+                    yield ''.join(chunk)
+                    chunk = []
+            chunk.append(']')
+            yield ''.join(chunk)
+        yield '}\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
\ No newline at end of file
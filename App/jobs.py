@@ -0,0 +1,179 @@
+import os
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.etree.ElementTree import ParseError
+
+from .database import get_db
+from .user_model import IngestJob
+
+# Uploads are written to UPLOAD_SPOOL_DIR and ingested off the request thread.
+#   INGEST_WORKERS=N  - a local pool of N threads (default 2)
+#   INGEST_WORKERS=0  - ingest inline inside the request (old behaviour)
+# configure_queue() swaps the local pool for an external queue (RQ, Celery, ...);
+# job progress lives in the ingest_jobs table so any worker can report it.
+#
+# Serverless functions (Vercel sets VERCEL=1) are frozen once the response is
+# sent, so background threads would never finish there: local jobs always run
+# inline on such platforms. Use configure_queue() for background ingest there.
+SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0" if SERVERLESS else "2"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "dash_uploads"))
+# Queued/running jobs without progress for this many seconds are reported as failed
+INGEST_STALE_AFTER = int(os.getenv("INGEST_STALE_AFTER", "900"))
+
+if SERVERLESS and INGEST_WORKERS > 0:
+    print("Warning: INGEST_WORKERS is ignored on a serverless platform; uploads are ingested inline.")
+
+_executor = None
+_executor_lock = threading.Lock()
+_submit = None
+
+def configure_queue(submit):
+    """
+    Send jobs through submit(run_job, job_id, path) instead of the local pool.
+    The worker must see the spool directory and the database. Pass None to go
+    back to the local pool.
+    """
+    global _submit
+    _submit = submit
+
+def _local_submit(fn, *args):
+    global _executor
+    if INGEST_WORKERS <= 0 or SERVERLESS:
+        fn(*args)
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+    _executor.submit(fn, *args)
+
+# ---
+## Job records
+
+def _update_job(job_id, **values):
+    with get_db() as session:
+        job = session.get(IngestJob, job_id)
+        if job is None:
+            return
+        for key, value in values.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.now()
+        session.commit()
+
+def _is_stale(job):
+    if job.status not in ('queued', 'running'):
+        return False
+    last_seen = job.updated_at or job.created_at
+    return last_seen is not None and (datetime.now() - last_seen).total_seconds() > INGEST_STALE_AFTER
+
+def job_status(job_id, user_id):
+    """Status dict for one of user_id's jobs, or None if there is no such job."""
+    with get_db() as session:
+        job = session.get(IngestJob, job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        if _is_stale(job):
+            # The worker died or was frozen mid-job; rows it committed are kept
+            job.status = 'failed'
+            job.error = (f"Ingest stopped without finishing; {job.inserted} rows were imported. "
+                         "Upload the file again to import the rest.")
+            job.finished_at = datetime.now()
+            session.commit()
+        return {
+            'job_id': job.id,
+            'filename': job.filename,
+            'status': job.status,
+            'parsed': job.parsed,
+            'inserted': job.inserted,
+            'error': job.error,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+def describe_job(status):
+    """One-line message for the user about a job status dict from job_status()."""
+    if status['status'] == 'done':
+        return f"Imported {status['inserted']} new transactions from {status['filename']}."
+    if status['status'] == 'failed':
+        return f"Upload of {status['filename']} failed: {status['error']}"
+    return f"File uploaded! Processing job {status['job_id']} in the background."
+
+# ---
+## Running jobs
+
+def _failure_message(detail, imported, retry="uploading the file again"):
+    # Chunks commit as they go, so the stored ones stay; say exactly how many
+    if imported:
+        outcome = (f"{imported} transactions were imported; "
+                   f"{retry} adds the rest without duplicating them.")
+    else:
+        outcome = "Nothing was imported."
+    return f"{detail[:1024 - len(outcome) - 2]}. {outcome}"
+
+def run_job(job_id, path):
+    """Parse and insert one spooled upload, recording progress on its job row."""
+    # Imported here so queue workers only pull in ingest when they run a job
+    from .parser import iter_transactions_parallel
+    from .manage_db import inserting_in_database, stored_transactions
+
+    with get_db() as session:
+        job = session.get(IngestJob, job_id)
+        user_id = job.user_id if job is not None else None
+    if user_id is None:
+        print(f"Ingest job {job_id} not found.")
+        return
+
+    _update_job(job_id, status='running')
+    counts = {'parsed': 0, 'inserted': 0}
+
+    def counted(transactions):
+        for txn in transactions:
+            counts['parsed'] += 1
+            yield txn
+
+    def progress(inserted):
+        counts['inserted'] = inserted
+        _update_job(job_id, parsed=counts['parsed'], inserted=inserted)
+
+    try:
+        with open(path, 'rb') as spooled:
+            stats = inserting_in_database(counted(iter_transactions_parallel(spooled)), user_id, progress=progress)
+        inserted = stored_transactions(stats)
+        _update_job(job_id, status='done', parsed=counts['parsed'], inserted=inserted, finished_at=datetime.now())
+    except ParseError as e:
+        _update_job(job_id, status='failed', parsed=counts['parsed'], inserted=counts['inserted'],
+                    error=_failure_message(f"Invalid XML: {e}", counts['inserted'], "uploading the corrected file"), finished_at=datetime.now())
+    except Exception as e:
+        print(f"Ingest job {job_id} failed: {e}")
+        _update_job(job_id, status='failed', parsed=counts['parsed'], inserted=counts['inserted'],
+                    error=_failure_message(str(e), counts['inserted']), finished_at=datetime.now())
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def submit_upload(file, user_id):
+    """Spool an uploaded FileStorage to disk and queue it for ingestion. Returns the job id."""
+    job_id = str(uuid.uuid4())
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_SPOOL_DIR, f"{job_id}.xml")
+    file.save(path)
+
+    with get_db() as session:
+        session.add(IngestJob(
+            id=job_id,
+            user_id=user_id,
+            filename=(file.filename or '')[:255],
+            status='queued',
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        ))
+        session.commit()
+
+    (_submit or _local_submit)(run_job, job_id, path)
+    return job_id
@@ -1,98 +1,557 @@
 import re
 import uuid
 import os
-from .parser import parser
-from sqlalchemy import Column, String, create_engine, DateTime, Float, text, Integer
-from sqlalchemy.orm import declarative_base, sessionmaker
-
-# Load environment variables
-DB = os.getenv("DATABASE_NAME")
-USER = os.getenv("USER_NAME")
-HOST = os.getenv("HOST")
-PASSWORD = os.getenv("PASSWORD")
-
-# Connect to MySQLpip
-try:
-    try:
-        import pymysql
-        pymysql.install_as_MySQLdb()
-        connection_string = f"mysql+mysqldb://{USER}:{PASSWORD}@{HOST}:3306/{DB}"
-        engine = create_engine(connection_string, pool_pre_ping=True, echo=False)
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        print(f"Connected successfully to {DB} using MySQLdb.")
-    except ModuleNotFoundError:
-        connection_string = f"mysql+pymysql://{USER}:{PASSWORD}@{HOST}/{DB}"
-        engine = create_engine(connection_string, pool_pre_ping=True, echo=False)
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        print(f"Connected successfully to {DB} using PyMySQL.")
-except Exception as e:
-    raise ConnectionError(f"Error connecting to {DB}: {e}")
-
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-Base = declarative_base()
+import time
+import operator
+import threading
+from datetime import datetime, timezone
+import click
+from .parser import parser, CATEGORIES
+from .database import get_engine
+from . import schema_cache, user_stats, storage, aggregate_cache
+from sqlalchemy import Column, String, DateTime, Float, Integer, insert, update, delete, select, literal, exists, text, case, func, extract, union_all, MetaData, Table, Index, inspect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+metadata = MetaData()
 
 def sanitize_table_name(name: str) -> str:
     cleaned_name = ''.join(c if c.isalnum() or c == '_' else '_' for c in name).lower()
     return re.sub(r'_{2,}', '_', cleaned_name).strip('_')
 
-def inserting_in_database(parsed_data: dict, user_id: int):
-    with SessionLocal() as session:
-        for table_name, transactions in parsed_data.items():
-            table_name_safe = sanitize_table_name(table_name)
-
-            # Define dynamic table class
-            attrs = {
-                '__tablename__': table_name_safe,
-                'id': Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4())),
-                'date': Column(DateTime),
-                'tra_type': Column(String(255)),
-                'new_balance': Column(Float),
-                'transaction_id': Column(String(255)),
-                'receiver_name': Column(String(255)),
-                'fee': Column(Float),
-                'amount': Column(Float),
-                'agent_number': Column(String(255)),
-                'sender_number': Column(String(255)),
-                'receiver_number': Column(String(255)),
-                'sender_name': Column(String(255)),
-                'third_party_name': Column(String(255)),
-                'user_id':Column(Integer, nullable=False)
-            }
-            DynamicTable = type(table_name_safe, (Base,), attrs)
+# Category table for messages the parser could not classify
+UNPROCESSED_TABLE = 'unprocessed_data'
+
+# Number of rows sent per executemany INSERT (and per commit)
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "1000"))
+
+def iter_category_batches(parsed_data, batch_size=INSERT_BATCH_SIZE):
+    """
+    Yields (category, transactions) pairs from either a categorized dict returned by
+    parser() or a stream of transactions from iter_transactions(). Streamed rows are
+    grouped per category and released in batches of at most batch_size.
+    """
+    if isinstance(parsed_data, dict):
+        yield from parsed_data.items()
+        return
+
+    pending = {}
+    for txn in parsed_data:
+        batch = pending.setdefault(txn['tra_type'], [])
+        batch.append(txn)
+        if len(batch) >= batch_size:
+            yield txn['tra_type'], batch
+            pending[txn['tra_type']] = []
+    for table_name, batch in pending.items():
+        if batch:
+            yield table_name, batch
+
+def transaction_columns(user_id_nullable=False):
+    """Fresh column set shared by every category table."""
+    return [
+        Column('id', String(36), primary_key=True, default=lambda: str(uuid.uuid4())),
+        Column('date', DateTime),
+        Column('tra_type', String(255)),
+        Column('new_balance', Float),
+        Column('transaction_id', String(255)),
+        Column('receiver_name', String(255)),
+        Column('fee', Float),
+        Column('amount', Float),
+        Column('agent_number', String(255)),
+        Column('sender_number', String(255)),
+        Column('receiver_number', String(255)),
+        Column('sender_name', String(255)),
+        Column('third_party_name', String(255)),
+        # tx:<TxId> or h:<content hash>, see parser.dedupe_key
+        Column('dedupe_key', String(64)),
+        Column('user_id', Integer, nullable=user_id_nullable),
+    ]
+
+# Secondary indexes every category table should carry: all reads filter on
+# user_id and then order/filter by date or group by tra_type.
+CATEGORY_INDEXES = {
+    'user_date': ('user_id', 'date'),
+    'user_type': ('user_id', 'tra_type'),
+}
+
+# A transaction is stored at most once per user. Rows ingested before dedupe_key
+# existed keep it NULL, which the unique index allows any number of times.
+UNIQUE_INDEXES = {
+    'user_dedupe': ('user_id', 'dedupe_key'),
+}
+
+def category_indexes(table_name_safe):
+    indexes = [Index(f"ix_{table_name_safe}_{suffix}", *columns) for suffix, columns in CATEGORY_INDEXES.items()]
+    indexes += [Index(f"ux_{table_name_safe}_{suffix}", *columns, unique=True) for suffix, columns in UNIQUE_INDEXES.items()]
+    return indexes
+
+def ensure_columns(table):
+    """Add declared nullable columns missing from an existing table. Returns their names."""
+    added = []
+    with get_engine().begin() as conn:
+        existing_columns = {column['name'] for column in inspect(conn).get_columns(table.name)}
+        preparer = conn.dialect.identifier_preparer
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}"
+            ))
+            added.append(column.name)
+    return added
+
+def ensure_indexes(table):
+    """Create any of table's declared indexes missing from the database. Returns their names."""
+    created = []
+    with get_engine().begin() as conn:
+        inspector = inspect(conn)
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = inspector.get_indexes(table.name)
+        existing_names = {index['name'] for index in existing_indexes}
+        existing_keys = {tuple(index['column_names']) for index in existing_indexes}
+        for index in table.indexes:
+            columns = tuple(column.name for column in index.columns)
+            if index.name in existing_names or columns in existing_keys:
+                continue
+            if not set(columns) <= existing_columns:
+                continue
+            index.create(bind=conn)
+            created.append(index.name)
+    return created
+
+# Process-wide registry of category tables: each one is declared on `metadata` and
+# verified against the database once, then reused by every later upload.
+_category_tables = {}
+_category_tables_lock = threading.Lock()
+
+def _register_table(name, build):
+    """Declare (via build) and verify a table once per process, then reuse it."""
+    table = _category_tables.get(name)
+    if table is not None:
+        return table
+
+    with _category_tables_lock:
+        table = _category_tables.get(name)
+        if table is None:
+            table = metadata.tables.get(name)
+            if table is None:
+                table = build()
+            table.create(bind=get_engine(), checkfirst=True)
+            # Tables created before the columns/indexes existed get them here
+            added = ensure_columns(table)
+            if added:
+                print(f"Added columns {', '.join(added)} to '{name}'.")
+            created = ensure_indexes(table)
+            if created:
+                print(f"Added indexes {', '.join(created)} to '{name}'.")
+            table.info['added_indexes'] = created
+            # The table may be new: make readers re-reflect it
+            schema_cache.invalidate(name)
+            _category_tables[name] = table
+    return table
+
+def get_category_table(table_name_safe):
+    """Return the Core Table for a category, declaring and creating it on first use."""
+    return _register_table(
+        table_name_safe,
+        lambda: Table(table_name_safe, metadata, *transaction_columns(), *category_indexes(table_name_safe)),
+    )
+
+def get_unified_table():
+    """
+    Return the single `transactions` table used in unified storage mode. It holds
+    every category (named by the `category` column) and, unlike the category
+    tables, accepts the user_id IS NULL sample rows so they can be migrated.
+    """
+    name = storage.UNIFIED_TABLE
+    return _register_table(
+        name,
+        lambda: Table(
+            name, metadata,
+            *transaction_columns(user_id_nullable=True),
+            Column('category', String(64), nullable=False),
+            *category_indexes(name),
+            Index(f"ix_{name}_user_category", 'user_id', 'category'),
+        ),
+    )
+
+def ensure_category_tables():
+    """Declare and verify every parser category table up front."""
+    for category in CATEGORIES:
+        get_category_table(sanitize_table_name(category))
+    return dict(_category_tables)
+
+def add_missing_indexes():
+    """Register every category table and add missing indexes. Returns {table: [created]}."""
+    created = {}
+    for category in CATEGORIES:
+        table = get_category_table(sanitize_table_name(category))
+        created[table.name] = table.info.get('added_indexes', []) + ensure_indexes(table)
+    return created
+
+@click.command('add-indexes')
+def add_indexes_command():
+    """Add dedupe_key and the secondary/unique indexes to existing category tables."""
+    for table_name, created in add_missing_indexes().items():
+        click.echo(f"{table_name}: {', '.join(created) if created else 'up to date'}")
+
+def migrate_to_unified():
+    """
+    Copy every category table into the unified `transactions` table. Rows already
+    copied (same id) are skipped, so the migration can be re-run safely.
+    Returns {category table: rows copied}.
+    """
+    unified = get_unified_table()
+    copied = {}
+    for category in CATEGORIES:
+        name = sanitize_table_name(category)
+        source = schema_cache.get_table(name)
+        if source is None:
+            continue
+        if 'id' not in source.c:
+            print(f"Skipping '{name}': it has no id column.")
+            continue
+
+        columns = [column.name for column in unified.columns if column.name in source.c and column.name != 'category']
+        already_copied = exists().where(unified.c.id == source.c.id)
+        query = select(*[source.c[column] for column in columns], literal(name)).where(~already_copied)
+        with get_engine().begin() as conn:
+            result = conn.execute(insert(unified).from_select(columns + ['category'], query))
+        copied[name] = result.rowcount
+    return copied
+
+@click.command('migrate-unified')
+def migrate_unified_command():
+    """Copy the per-category tables into the unified transactions table."""
+    for table_name, count in migrate_to_unified().items():
+        click.echo(f"{table_name}: {count} rows copied")
+    click.echo("Set TRANSACTION_STORAGE=unified to read and write the unified table.")
+
+# ---
+## Rollups
+# transaction_rollups holds, per (user_id, category, month), the figures the
+# dashboard and charts are built from. Ingest adds each chunk's rows to it in the
+# chunk's own transaction, so reads scale with months rather than transactions.
+# Only the ten transaction categories are rolled up; the sample data
+# (user_id IS NULL) is not, it is read raw and cached in memory instead.
+
+ROLLUP_TABLE = storage.ROLLUP_TABLE
+# Month key for rows without a date: they count in the totals but in no month
+NO_MONTH = ''
+
+def get_rollup_table():
+    return _register_table(
+        ROLLUP_TABLE,
+        lambda: Table(
+            ROLLUP_TABLE, metadata,
+            Column('user_id', Integer, primary_key=True, autoincrement=False),
+            Column('category', String(64), primary_key=True),
+            Column('month', String(7), primary_key=True),
+            Column('row_count', Integer, nullable=False, default=0),
+            # Rows with an amount, their sum, min and max
+            Column('amount_count', Integer, nullable=False, default=0),
+            Column('amount_total', Float, nullable=False, default=0.0),
+            Column('amount_min', Float),
+            Column('amount_max', Float),
+        ),
+    )
+
+def rollup_month(date):
+    return date.strftime('%Y-%m') if date else NO_MONTH
+
+def _add_to_rollup(totals, amount):
+    totals['row_count'] += 1
+    if amount is not None:
+        totals['amount_count'] += 1
+        totals['amount_total'] += amount
+        totals['amount_min'] = amount if totals['amount_min'] is None else min(totals['amount_min'], amount)
+        totals['amount_max'] = amount if totals['amount_max'] is None else max(totals['amount_max'], amount)
+
+def _empty_rollup(user_id, category, month):
+    return {
+        'user_id': user_id, 'category': category, 'month': month,
+        'row_count': 0, 'amount_count': 0, 'amount_total': 0.0, 'amount_min': None, 'amount_max': None,
+    }
 
+def rollup_rows(user_id, category, rows):
+    """Rollup rows (one per month) summarising freshly inserted transaction rows."""
+    months = {}
+    for row in rows:
+        month = rollup_month(row.get('date'))
+        totals = months.setdefault(month, _empty_rollup(user_id, category, month))
+        _add_to_rollup(totals, row.get('amount'))
+    return list(months.values())
+
+def _merged_rollup_values(table, incoming):
+    """SET clause adding an incoming rollup row (column name -> expression) to the stored one."""
+    c = table.c
+
+    def pick(better, column):
+        value = incoming[column.name]
+        return case(
+            (column.is_(None), value),
+            (value.is_(None), column),
+            (better(value, column), value),
+            else_=column,
+        )
+
+    return {
+        'row_count': c.row_count + incoming['row_count'],
+        'amount_count': c.amount_count + incoming['amount_count'],
+        'amount_total': c.amount_total + incoming['amount_total'],
+        'amount_min': pick(operator.lt, c.amount_min),
+        'amount_max': pick(operator.gt, c.amount_max),
+    }
+
+def add_to_rollups(conn, table, rows):
+    """Merge rollup rows into the rollup table on conn (upsert per key)."""
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        conn.execute(stmt.on_duplicate_key_update(_merged_rollup_values(table, stmt.inserted)), rows)
+        return
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'category', 'month'],
+            set_=_merged_rollup_values(table, stmt.excluded),
+        )
+        conn.execute(stmt, rows)
+        return
+
+    for row in rows:
+        key = [table.c.user_id == row['user_id'], table.c.category == row['category'], table.c.month == row['month']]
+        incoming = {name: literal(value, table.c[name].type) for name, value in row.items()}
+        result = conn.execute(update(table).where(*key).values(_merged_rollup_values(table, incoming)))
+        if result.rowcount == 0:
+            conn.execute(insert(table), row)
+
+def rebuild_rollups():
+    """
+    Recompute transaction_rollups from the stored transactions (either layout) and
+    align user_data_stats row counts with them. Returns {user_id: rows rolled up}.
+    """
+    from .user_model import UserDataStats
+
+    table = get_rollup_table()
+    selects = []
+    for source, category, conditions in storage.transaction_sources(columns=('user_id', 'date', 'amount')):
+        selects.append(
+            select(category.label('category'), source.c.user_id, source.c.date, source.c.amount)
+            .where(source.c.user_id.isnot(None), *conditions)
+        )
+
+    rollups = {}
+    if selects:
+        merged = union_all(*selects).subquery() if len(selects) > 1 else selects[0].subquery()
+        year = extract('year', merged.c.date)
+        month = extract('month', merged.c.date)
+        query = select(
+            merged.c.user_id, merged.c.category, year, month,
+            func.count(), func.count(merged.c.amount), func.sum(merged.c.amount),
+            func.min(merged.c.amount), func.max(merged.c.amount),
+        ).group_by(merged.c.user_id, merged.c.category, year, month)
+        with get_engine().connect() as conn:
+            for user_id, category, year_value, month_value, count, amount_count, total, low, high in conn.execute(query):
+                month_key = NO_MONTH
+                if year_value is not None and month_value is not None:
+                    month_key = f"{int(year_value):04d}-{int(month_value):02d}"
+                rollups[(user_id, category, month_key)] = {
+                    'user_id': user_id, 'category': category, 'month': month_key,
+                    'row_count': count, 'amount_count': amount_count, 'amount_total': total or 0.0,
+                    'amount_min': low, 'amount_max': high,
+                }
+
+    per_user = {}
+    for (user_id, _, _), row in rollups.items():
+        per_user[user_id] = per_user.get(user_id, 0) + row['row_count']
+
+    stats_table = UserDataStats.__table__
+    with get_engine().begin() as conn:
+        conn.execute(delete(table))
+        if rollups:
+            conn.execute(insert(table), list(rollups.values()))
+        # Readers only trust rollups that agree with the user's recorded row count
+        conn.execute(update(stats_table).values(row_count=0))
+        for user_id, count in per_user.items():
+            conn.execute(update(stats_table).where(stats_table.c.user_id == user_id).values(row_count=count))
+    # New row counts move each user's data version, and with it their cached aggregates
+    user_stats.invalidate()
+    return per_user
+
+@click.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the per-user monthly rollups from the transaction tables."""
+    per_user = rebuild_rollups()
+    click.echo(f"Rebuilt rollups for {len(per_user)} users ({sum(per_user.values())} transactions).")
+
+def prepare_row(txn, user_id, column_names):
+    """Turn one parsed transaction into a complete row dict for a Core insert."""
+    row = {name: txn.get(name) for name in column_names}
+    row['id'] = txn.get('id') or str(uuid.uuid4())
+    row['user_id'] = user_id
+    # Clean numeric fields before inserting
+    if row.get('amount') is not None:
+        row['amount'] = float(str(row['amount']).replace(',', ''))
+    if row.get('fee') is not None:
+        row['fee'] = float(str(row['fee']).replace(',', ''))
+    return row
+
+def insert_ignoring_duplicates(table):
+    """
+    Bulk INSERT that leaves rows already present (same user_id, dedupe_key) alone:
+    ON DUPLICATE KEY on MySQL, ON CONFLICT DO NOTHING on SQLite/PostgreSQL.
+    """
+    dialect = get_engine().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        # No-op update: the existing row wins
+        return stmt.on_duplicate_key_update(dedupe_key=stmt.inserted.dedupe_key)
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def drop_known_rows(conn, table, user_id, rows):
+    """Remove rows whose dedupe_key is repeated in the batch or already stored for user_id."""
+    unique_rows = {}
+    for row in rows:
+        unique_rows.setdefault(row.get('dedupe_key') or row['id'], row)
+    rows = list(unique_rows.values())
+
+    keys = [row['dedupe_key'] for row in rows if row.get('dedupe_key')]
+    if not keys or 'dedupe_key' not in table.c:
+        return rows
+    query = select(table.c.dedupe_key).where(storage.user_filter(table, user_id), table.c.dedupe_key.in_(keys))
+    known = set(conn.execute(query).scalars())
+    return [row for row in rows if row.get('dedupe_key') not in known]
+
+def landed_rows(conn, table, rows):
+    """
+    The rows of a just-executed insert_ignoring_duplicates() that were written.
+    Rows a concurrent upload stored first were ignored by the insert; their fresh
+    ids are not in the table, so re-selecting the ids tells them apart.
+    """
+    written = set(conn.execute(select(table.c.id).where(table.c.id.in_([row['id'] for row in rows]))).scalars())
+    return [row for row in rows if row['id'] in written]
+
+def inserting_in_database(parsed_data, user_id: int, chunk_size: int = INSERT_BATCH_SIZE, progress=None):
+    """
+    Inserts parsed transactions for user_id. parsed_data may be the dict returned by
+    parser() or a transaction stream from iter_transactions(), which is consumed
+    while it is still being parsed.
+
+    Rows are written with Core executemany INSERTs of at most chunk_size rows, each
+    chunk in its own transaction together with its rollup update. In unified storage
+    mode every category goes to the `transactions` table instead of its own table.
+
+    Re-uploads are idempotent: transactions the user already has (same dedupe_key)
+    are skipped before the insert, and the insert itself ignores duplicate keys in
+    case a concurrent upload got there first. Counts and rollups only include the
+    rows that actually landed.
+
+    Each chunk also adds its rows to the user's user_data_stats record in the same
+    transaction, so an upload that fails halfway leaves the stats, the rollups and
+    the stored rows in agreement.
+
+    A chunk that cannot be written (database error, lost connection, ...) is
+    rolled back and the rest of the upload still goes in; once everything else
+    is stored a RuntimeError names what was lost, so callers never take a
+    partial upload for a complete one.
+
+    progress, if given, is called with the running number of stored transactions
+    after every chunk (unrecognised messages are not counted).
+    Returns {category table: (rows_inserted, seconds)}.
+    """
+    stats = {}
+    skipped = {}
+    # (table, rows, error) for every chunk that could not be written
+    failed = []
+    # upload_count goes up once, with the first chunk that stores anything
+    upload_recorded = False
+    # Declared before any chunk transaction opens: table creation must not run inside one
+    rollup_table = get_rollup_table()
+    for table_name, transactions in iter_category_batches(parsed_data, chunk_size):
+        table_name_safe = sanitize_table_name(table_name)
+
+        try:
+            if storage.is_unified():
+                table = get_unified_table()
+            else:
+                table = get_category_table(table_name_safe)
+        except Exception as e:
+            print(f"Error creating table '{table_name_safe}': {e}")
+            failed.append((table_name_safe, len(transactions), e))
+            continue
+
+        column_names = [column.name for column in table.columns]
+        inserted, elapsed = stats.get(table_name_safe, (0, 0.0))
+
+        for offset in range(0, len(transactions), chunk_size):
+            rows = [prepare_row(txn, user_id, column_names) for txn in transactions[offset:offset + chunk_size]]
+            if 'category' in column_names:
+                for row in rows:
+                    row['category'] = table_name_safe
+            started = time.perf_counter()
+            batch_size = len(rows)
             try:
-                DynamicTable.__table__.create(bind=engine, checkfirst=True)
+                with get_engine().begin() as conn:
+                    if not upload_recorded:
+                        user_stats.ensure_record(conn, user_id)
+                    rows = drop_known_rows(conn, table, user_id, rows)
+                    if rows:
+                        conn.execute(insert_ignoring_duplicates(table), rows)
+                        rows = landed_rows(conn, table, rows)
+                        if table_name_safe in storage.TRANSACTION_TABLES:
+                            add_to_rollups(conn, rollup_table, rollup_rows(user_id, table_name_safe, rows))
+                    if rows:
+                        # Unrecognised messages never show up on the dashboard, so they do not count as data
+                        counted = len(rows) if table_name_safe in storage.TRANSACTION_TABLES else 0
+                        user_stats.add_upload_rows(conn, user_id, counted, 0 if upload_recorded else 1,
+                                                   datetime.now(timezone.utc).replace(tzinfo=None))
             except Exception as e:
-                print(f"Error creating table '{table_name_safe}': {e}")
+                print(f"Failed to insert rows into '{table_name_safe}': {e}")
+                failed.append((table_name_safe, batch_size, e))
                 continue
+            if rows:
+                upload_recorded = True
+                # New rows: drop this worker's cached stats so the user's data version (which
+                # keys their cached totals, charts and pages) moves on; None is the sample data
+                user_stats.invalidate(user_id)
+                aggregate_cache.invalidate(user_id)
+            skipped[table_name_safe] = skipped.get(table_name_safe, 0) + batch_size - len(rows)
+            inserted += len(rows)
+            elapsed += time.perf_counter() - started
+            if progress is not None:
+                stats[table_name_safe] = (inserted, elapsed)
+                progress(stored_transactions(stats))
 
-            rows_to_insert = []
-            for txn in transactions:
-                txn['user_id'] = user_id
-                # Clean numeric fields before inserting
-                if 'amount' in txn and txn['amount'] is not None:
-                    txn['amount'] = float(str(txn['amount']).replace(',', ''))
-                if 'fee' in txn and txn['fee'] is not None:
-                    txn['fee'] = float(str(txn['fee']).replace(',', ''))
-
-                filtered_data = {k: v for k, v in txn.items() if v is not None}
-                if 'id' not in filtered_data:
-                    filtered_data['id'] = str(uuid.uuid4())
-                row_instance = DynamicTable(**filtered_data)
-                rows_to_insert.append(row_instance)
-
-            if rows_to_insert:
-                try:
-                    session.add_all(rows_to_insert)
-                    session.commit()
-                    print(f"{len(rows_to_insert)} rows inserted into '{table_name_safe}' table.")
-                except Exception as e:
-                    session.rollback()
-                    print(f"Failed to insert rows into '{table_name_safe}': {e}")
-            else:
-                print(f"No valid transactions for table '{table_name_safe}'.")
+        stats[table_name_safe] = (inserted, elapsed)
+
+    for table_name_safe, (inserted, elapsed) in stats.items():
+        if inserted:
+            rate = inserted / elapsed if elapsed else float(inserted)
+            print(f"{inserted} rows inserted into '{table_name_safe}' table ({rate:.0f} rows/s).")
+        elif skipped.get(table_name_safe):
+            print(f"No new transactions for table '{table_name_safe}'.")
+        else:
+            print(f"No valid transactions for table '{table_name_safe}'.")
+        if skipped.get(table_name_safe):
+            print(f"{skipped[table_name_safe]} duplicate rows skipped for '{table_name_safe}'.")
+    if failed:
+        tables = ", ".join(sorted({name for name, _, _ in failed}))
+        raise RuntimeError(
+            f"{sum(count for _, count, _ in failed)} rows in {len(failed)} chunk(s) could not be stored "
+            f"({tables}): {failed[0][2]}"
+        )
+    return stats
+
+def stored_transactions(stats):
+    """Transactions stored according to an inserting_in_database() stats dict, leaving out unprocessed_data."""
+    return sum(count for name, (count, _) in stats.items() if name in storage.TRANSACTION_TABLES)
 if __name__ == '__main__':
     file_path = r'C:\Users\user\Desktop\Dash\App\data.xml'
     parsed_data = parser(file_path)
@@ -1,5 +1,28 @@
+import hashlib
+import os
 from functools import wraps
-from flask import flash, redirect, url_for, session
+from flask import flash, redirect, url_for, session, request, make_response
+
+from .user_stats import data_version
+
+def _build_version():
+    """Identifies the deployed code, so a release changes every ETag even when the data does not."""
+    version = os.getenv("APP_VERSION") or os.getenv("VERCEL_GIT_COMMIT_SHA")
+    if version:
+        return version
+    # No release id configured: fingerprint the code and templates that render the views
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for name in sorted(files):
+            if name.endswith(('.py', '.html')):
+                with open(os.path.join(folder, name), 'rb') as source:
+                    digest.update(name.encode())
+                    digest.update(source.read())
+    return digest.hexdigest()[:12]
+
+BUILD_VERSION = _build_version()
 
 def login_required(f):
     @wraps(f)
@@ -9,4 +32,47 @@ def login_required(f):
             return redirect(url_for('auth.login'))
         return f(*k,**ka)
 
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def data_versioned(f):
+    """
+    Strong ETag and Last-Modified for views whose output only depends on the
+    logged-in user's data. A conditional request that still matches gets a 304
+    before the view runs, so no aggregate or listing query is made.
+    """
+    @wraps(f)
+    def decorated_function(*k, **ka):
+        version = data_version(session.get('user_id'))
+        if version is None:
+            # No data version yet (first visit); the view records one
+            return f(*k, **ka)
+        seed, last_modified = version
+        etag = hashlib.sha256(f"{BUILD_VERSION}|{seed}|{request.full_path}".encode()).hexdigest()[:32]
+        if last_modified is not None:
+            last_modified = last_modified.replace(microsecond=0)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = bool(
+                last_modified and request.if_modified_since
+                and last_modified <= request.if_modified_since.replace(tzinfo=None)
+            )
+
+        if not_modified:
+            response = make_response('', 304)
+        else:
+            response = make_response(f(*k, **ka))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Per-user content: browsers may keep it but must revalidate every time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    return decorated_function
@@ -1,152 +1,301 @@
+import os
 import re
+import hashlib
+import threading
+import multiprocessing
 import xml.etree.ElementTree
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 import io
 
-def parser(xml_data_stream):
+# Parallel parsing: messages are categorized in chunks of PARSE_CHUNK_SIZE across
+# PARSE_WORKERS processes. 0 or 1 worker parses serially in the calling process.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+PARSE_CHUNK_SIZE = int(os.getenv("PARSE_CHUNK_SIZE", "2000"))
+
+# Worker pools are started once and shared by every upload. The app runs ingest
+# on threads, and forking a threaded process can copy locks held by other
+# threads into the child, so workers are started with forkserver (or spawn
+# where forkserver does not exist) rather than fork.
+_pools = {}
+_pools_lock = threading.Lock()
+
+# ---
+## Precompiled rules
+# Every pattern is compiled once at import time. Each category rule carries the
+# literal markers its regex cannot match without, so a body is only handed to
+# the extraction regex of the categories whose markers it actually contains.
+
+TRANSACTION_ID_RE = re.compile(r'TxId: (\d+)')
+AMOUNT_RE = re.compile(r'(\d{1,3}(?:,\d{3})*) RWF')
+FEE_RE = re.compile(r'Fee was:?\s*(.*?) RWF')
+BALANCE_RE = re.compile(r'(Your\s+)?new\s+balance\s*:\s*(\d+) RWF', re.IGNORECASE)
+
+
+def _incoming_money(match, txn):
+    txn['sender_name'] = match.group(2).strip()
+    txn['amount'] = match.group(1).replace(",", "")
+    txn['sender_number'] = match.group(3).strip()
+
+def _bank_deposit(match, txn):
+    txn['amount'] = match.group(1).replace(",", "")
+
+def _transfer_to_mobile(match, txn):
+    txn['amount'] = match.group(2).replace(",", "")
+    txn['receiver_name'] = match.group(3).strip()
+    txn['receiver_number'] = match.group(4)
+
+def _payment_to_code_holder(match, txn):
+    txn['receiver_name'] = match.group(3).strip()
+    txn['amount'] = match.group(2).replace(",", "")
+
+def _third_party(match, txn):
+    txn['third_party_name'] = match.group(2).strip()
+    txn['amount'] = match.group(1).replace(",", "")
+
+def _agent_withdrawal(match, txn):
+    txn['agent_number'] = match.group(2)
+    txn['amount'] = match.group(3).replace(",", "")
+
+def _cash_power(match, txn):
+    txn['amount'] = match.group(1).replace(",", "")
+
+def _token_payment(match, txn):
+    txn['transaction_id'] = match.group(2)
+    txn['amount'] = match.group(3).replace(",", "")
+
+def _bank_transfer(match, txn):
+    txn['amount'] = float(match.group(1).replace(",", ""))
+
+
+# (category, literal markers, compiled regex, field extractor)
+# Order matters: when several rules match, the last one decides the category,
+# exactly like the original chain of independent re.search calls.
+CATEGORY_RULES = [
+    ('Incoming_Money',
+     ('You have received',),
+     re.compile(r'You have received (.*?) RWF from (.*?) \((\*?\d{9,15})\) on your mobile money account'),
+     _incoming_money),
+    ('Bank_Deposits',
+     ('A bank deposit of',),
+     re.compile(r'A bank deposit of (.*?) RWF has been added to your mobile money account'),
+     _bank_deposit),
+    ('Transfers_to_Mobile_Numbers',
+     ('*S*', 'RWF transferred to '),
+     re.compile(r'\*(\d+)\*S\*(\d+)\sRWF transferred to ([A-Z][a-z]+(?: [A-Z][a-z]+)) \((\d{9,15})\) from (\d+)'),
+     _transfer_to_mobile),
+    ('Payments_to_Code_Holders',
+     ('TxId: ', 'Your payment of', 'has been completed'),
+     re.compile(r'TxId: (\d+)\.\s*Your payment of (.*?) RWF to\s*([A-Z][a-z]+(?: [A-Z][a-z]+)*)(?:\s+\d+)?\s+has been completed'),
+     _payment_to_code_holder),
+    ('Transactions_Initiated_by_Third_Parties',
+     ('A transaction of', 'on your MOMO account was successfully completed'),
+     re.compile(r'A transaction of (.*?) RWF by (.*?) on your MOMO account was successfully completed'),
+     _third_party),
+    ('Withdrawals_from_Agents',
+     ('have via agent: Agent ',),
+     re.compile(r'You Abebe Chala CHEBUDIE \(.*?036\) have via agent: Agent ([A-Z][a-z]+(?: [A-Z][a-z]+)*) \((\d+)\), withdrawn (.*?) RWF from your mobile money '),
+     _agent_withdrawal),
+    ('Cash_Power_Bill_Payments',
+     ('RWF to MTN Cash Power',),
+     re.compile(r'Your payment of (.*?) RWF to MTN Cash Power'),
+     _cash_power),
+    ('Airtime_Bill_Payments',
+     ('*TxId:', 'RWF to Airtime with token has been completed'),
+     re.compile(r'(\d+)\*TxId:(\d+)\*S\*Your payment of (\d{1,3}(?:,\d{3})*) RWF to Airtime with token has been completed'),
+     _token_payment),
+    ('Bundle_Purchases',
+     ('*TxId:', 'RWF to Bundles and Packs with token has been completed'),
+     re.compile(r'(\d+)\*TxId:(\d+)\*S\*Your payment of (\d{1,3}(?:,\d{3})*) RWF to Bundles and Packs with token has been completed(?:.*)?'),
+     _token_payment),
+    ('Bank_Transfers',
+     ('A bank Transfer of',),
+     re.compile(r'A bank Transfer of (.*?)'),
+     _bank_transfer),
+]
+
+CATEGORIES = [
+    'Bank_Transfers',
+    'Withdrawals_from_Agents',
+    'Transactions_Initiated_by_Third_Parties',
+    'Bundle_Purchases',
+    'Cash_Power_Bill_Payments',
+    'Airtime_Bill_Payments',
+    'Bank_Deposits',
+    'Transfers_to_Mobile_Numbers',
+    'Payments_to_Code_Holders',
+    'Incoming_Money',
+    'unprocessed_data'
+]
+
+
+def dedupe_key(txn, sms_body, transaction_date):
+    """
+    Identity of a transaction across uploads: its TxId when the SMS has one,
+    otherwise a hash of the date, body and amount.
+    """
+    if txn.get('transaction_id'):
+        return f"tx:{txn['transaction_id']}"
+    content = f"{transaction_date}|{sms_body}|{txn.get('amount')}"
+    return 'h:' + hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def categorize_sms(sms_body, transaction_date):
+    """
+    Builds a single transaction dict from one SMS body and its readable date.
+    """
+    try:
+        formated_date = datetime.strptime(transaction_date, '%d %b %Y %I:%M:%S %p')
+    except ValueError:
+        formated_date = None
+
+    single_transaction = {
+        'date': formated_date,
+        'amount': None,
+        'fee': None,
+        'new_balance': None,
+        'tra_type': 'unprocessed_data',
+        'sender_name': None,
+        'receiver_name': None,
+        'transaction_id': None
+    }
+
+    # General matches
+    transaction_id_match = TRANSACTION_ID_RE.search(sms_body)
+    if transaction_id_match:
+        single_transaction['transaction_id'] = transaction_id_match.group(1)
+
+    amount_match = AMOUNT_RE.search(sms_body)
+    if amount_match:
+        single_transaction['amount'] = amount_match.group(1).replace(",", "")
+
+    fee_match = FEE_RE.search(sms_body)
+    if fee_match:
+        single_transaction['fee'] = fee_match.group(1).replace(',', '')
+
+    balance_match = BALANCE_RE.search(sms_body)
+    if balance_match:
+        single_transaction['new_balance'] = balance_match.group(2).replace(',', '')
+
+    # Specific category matches, only for the rules whose markers are present
+    for category, markers, pattern, extract in CATEGORY_RULES:
+        if not all(marker in sms_body for marker in markers):
+            continue
+        match_found = pattern.search(sms_body)
+        if match_found:
+            single_transaction['tra_type'] = category
+            extract(match_found, single_transaction)
+
+    single_transaction['dedupe_key'] = dedupe_key(single_transaction, sms_body, transaction_date)
+    return single_transaction
+
+
+def iter_sms(xml_data_stream):
+    """
+    Streams an XML data stream and yields (body, readable_date) for every <sms>.
+
+    Each <sms> element is cleared once it has been read, so memory stays flat no
+    matter how large the backup is. Parse errors are raised to the caller.
+    """
+    root = None
+    for event, elem in xml.etree.ElementTree.iterparse(xml_data_stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        if elem.tag != 'sms':
+            continue
+        yield elem.get('body'), elem.get('readable_date')
+        elem.clear()
+        # Drop the cleared element from the root so the tree does not keep growing
+        root.clear()
+
+
+def iter_transactions(xml_data_stream):
+    """
+    Streams an XML data stream and yields categorized transactions one by one.
+
+    Args:
+        xml_data_stream: A file-like object (or path) containing the XML data.
+    """
+    for sms_body, transaction_date in iter_sms(xml_data_stream):
+        yield categorize_sms(sms_body, transaction_date)
+
+
+def _categorize_chunk(messages):
+    return [categorize_sms(sms_body, transaction_date) for sms_body, transaction_date in messages]
+
+
+def _get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pools[workers] = pool
+        return pool
+
+def _discard_pool(workers, pool):
+    # A worker died (OOM kill, ...): the next upload starts a fresh pool
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_transactions_parallel(xml_data_stream, workers=None, chunk_size=None):
+    """
+    Like iter_transactions(), but categorizes chunks of chunk_size messages on a
+    pool of worker processes. Transactions come out in document order.
+
+    XML reading stays in this process; only the regex work is spread out. At most
+    2 * workers chunks are in flight, so memory stays bounded on large backups.
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    chunk_size = chunk_size or PARSE_CHUNK_SIZE
+    if workers <= 1:
+        yield from iter_transactions(xml_data_stream)
+        return
+
+    pool = _get_pool(workers)
+    pending = deque()
+    try:
+        chunk = []
+        for message in iter_sms(xml_data_stream):
+            chunk.append(message)
+            if len(chunk) < chunk_size:
+                continue
+            pending.append(pool.submit(_categorize_chunk, chunk))
+            chunk = []
+            # Hand back finished chunks in order before reading further ahead
+            while len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        if chunk:
+            pending.append(pool.submit(_categorize_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _discard_pool(workers, pool)
+        raise
+    finally:
+        # Stopped early (parse error, abandoned generator): drop this upload's queued chunks
+        for future in pending:
+            future.cancel()
+
+
+def parser(xml_data_stream, workers=None):
     """
     Parses an XML data stream and categorizes transactions.
     
     Args:
         xml_data_stream: A file-like object containing the XML data.
+        workers: Parser processes to use (defaults to PARSE_WORKERS).
     """
-    categorized_type = {
-        'Bank_Transfers': [],
-        'Withdrawals_from_Agents': [],
-        'Transactions_Initiated_by_Third_Parties': [],
-        'Bundle_Purchases': [],
-        'Cash_Power_Bill_Payments': [],
-        'Airtime_Bill_Payments': [],
-        'Bank_Deposits': [],
-        'Transfers_to_Mobile_Numbers': [],
-        'Payments_to_Code_Holders': [],
-        'Incoming_Money': [],
-        'unprocessed_data': []
-    }
+    categorized_type = {category: [] for category in CATEGORIES}
 
     try:
-        tree = xml.etree.ElementTree.parse(xml_data_stream)
-        root = tree.getroot()
-
-        for sms_tag in root.findall('sms'):
-            sms_body = sms_tag.get('body')
-            transaction_date = sms_tag.get('readable_date')
-            
-            try:
-                formated_date = datetime.strptime(transaction_date, '%d %b %Y %I:%M:%S %p')
-            except ValueError:
-                formated_date = None
-            
-            single_transaction = {
-                'date': formated_date,
-                'amount': None,
-                'fee': None,
-                'new_balance': None,
-                'tra_type': 'unprocessed_data',
-                'sender_name': None,
-                'receiver_name': None,
-                'transaction_id': None
-            }
-            
-            # General matches
-            transaction_id_match = re.search(r'TxId: (\d+)', sms_body)
-            if transaction_id_match:
-                single_transaction['transaction_id'] = transaction_id_match.group(1)
-
-            amount_match = re.search(r'(\d{1,3}(?:,\d{3})*) RWF', sms_body)
-            if amount_match:
-                single_transaction['amount'] = amount_match.group(1).replace(",", "")
-
-            fee_match = re.search(r'Fee was:?\s*(.*?) RWF', sms_body)
-            if fee_match:
-                single_transaction['fee'] = fee_match.group(1).replace(',', '')
-
-            balance_match = re.search(r'(Your\s+)?new\s+balance\s*:\s*(\d+) RWF', sms_body, re.IGNORECASE)
-            if balance_match:
-                single_transaction['new_balance'] = balance_match.group(2).replace(',', '')
-            
-            # Specific category matches
-            is_categorized = False
-
-            # Incoming Money
-            match_found = re.search(r'You have received (.*?) RWF from (.*?) \((\*?\d{9,15})\) on your mobile money account', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Incoming_Money'
-                single_transaction['sender_name'] = match_found.group(2).strip()
-                single_transaction['amount'] = match_found.group(1).replace(",", "")
-                single_transaction['sender_number'] = match_found.group(3).strip()
-                is_categorized = True
-
-            # Bank Deposits
-            match_found = re.search(r'A bank deposit of (.*?) RWF has been added to your mobile money account', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Bank_Deposits'
-                single_transaction['amount'] = match_found.group(1).replace(",", "")
-                is_categorized = True
-            
-            # Payments to Mobile Numbers
-            match_found = re.search(r'\*(\d+)\*S\*(\d+)\sRWF transferred to ([A-Z][a-z]+(?: [A-Z][a-z]+)) \((\d{9,15})\) from (\d+)', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Transfers_to_Mobile_Numbers'
-                single_transaction['amount'] = match_found.group(2).replace(",", "")
-                single_transaction['receiver_name'] = match_found.group(3).strip()
-                single_transaction['receiver_number'] = match_found.group(4)
-                is_categorized = True
-
-            # Payments to Code Holders
-            match_found = re.search(r'TxId: (\d+)\.\s*Your payment of (.*?) RWF to\s*([A-Z][a-z]+(?: [A-Z][a-z]+)*)(?:\s+\d+)?\s+has been completed', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Payments_to_Code_Holders'
-                single_transaction['receiver_name'] = match_found.group(3).strip()
-                single_transaction['amount'] = match_found.group(2).replace(",", "")
-                is_categorized = True
-
-            # Payments Initiated by Third Parties
-            match_found = re.search(r'A transaction of (.*?) RWF by (.*?) on your MOMO account was successfully completed', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Transactions_Initiated_by_Third_Parties'
-                single_transaction['third_party_name'] = match_found.group(2).strip()
-                single_transaction['amount'] = match_found.group(1).replace(",", "")
-                is_categorized = True
-
-            # Withdrawals from Agents
-            match_found = re.search(r'You Abebe Chala CHEBUDIE \(.*?036\) have via agent: Agent ([A-Z][a-z]+(?: [A-Z][a-z]+)*) \((\d+)\), withdrawn (.*?) RWF from your mobile money ', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Withdrawals_from_Agents'
-                single_transaction['agent_number'] = match_found.group(2)
-                single_transaction['amount'] = match_found.group(3).replace(",", "")
-                is_categorized = True
-
-            # Cash Power Payments
-            match_found = re.search(r'Your payment of (.*?) RWF to MTN Cash Power', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Cash_Power_Bill_Payments'
-                single_transaction['amount'] = match_found.group(1).replace(",", "")
-                is_categorized = True
-
-            # Airtime Payments
-            match_found = re.search(r'(\d+)\*TxId:(\d+)\*S\*Your payment of (\d{1,3}(?:,\d{3})*) RWF to Airtime with token has been completed', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Airtime_Bill_Payments'
-                single_transaction['transaction_id'] = match_found.group(2)
-                single_transaction['amount'] = match_found.group(3).replace(",", "")
-                is_categorized = True
-
-            # Bundles Payments
-            match_found = re.search(r'(\d+)\*TxId:(\d+)\*S\*Your payment of (\d{1,3}(?:,\d{3})*) RWF to Bundles and Packs with token has been completed(?:.*)?', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Bundle_Purchases'
-                single_transaction['amount'] = match_found.group(3).replace(",", "")
-                single_transaction['transaction_id'] = match_found.group(2)
-                is_categorized = True
-
-            # Bank Transfer
-            match_found = re.search(r'A bank Transfer of (.*?)', sms_body)
-            if match_found:
-                single_transaction['tra_type'] = 'Bank_Transfers'
-                single_transaction['amount'] = float(match_found.group(1).replace(",", ""))
-                is_categorized = True
-
+        for single_transaction in iter_transactions_parallel(xml_data_stream, workers):
             # Store the categorized transaction
             categorized_type[single_transaction['tra_type']].append(single_transaction)
             
@@ -157,4 +306,4 @@ def parser(xml_data_stream):
         print(f"An unexpected error occurred during parsing: {e}")
         return None
     
-    return categorized_type
\ No newline at end of file
+    return categorized_type
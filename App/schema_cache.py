@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+from sqlalchemy import inspect, Table, MetaData
+
+from .database import get_engine
+
+# Process-wide cache of reflected table metadata. Tables are reflected once and
+# column checks are answered from memory. Ingest invalidates the cache when it
+# creates a table; the table list is also re-read after SCHEMA_CACHE_TTL seconds
+# so tables created by other workers show up.
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "300"))
+
+_lock = threading.Lock()
+_metadata = MetaData()
+_tables = {}
+_table_names = None
+_table_names_loaded_at = 0.0
+
+def table_names():
+    """Names of every table in the database."""
+    global _table_names, _table_names_loaded_at
+    names = _table_names
+    if names is None or time.monotonic() - _table_names_loaded_at > SCHEMA_CACHE_TTL:
+        with _lock:
+            names = set(inspect(get_engine()).get_table_names())
+            _table_names = names
+            _table_names_loaded_at = time.monotonic()
+    return names
+
+def get_table(name):
+    """Reflected Table for name, or None if the table does not exist."""
+    table = _tables.get(name)
+    if table is not None:
+        return table
+    if name not in table_names():
+        return None
+
+    with _lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Table(name, _metadata, autoload_with=get_engine())
+            _tables[name] = table
+    return table
+
+def invalidate(name=None):
+    """Forget cached reflection for one table (or all of them) and the table list."""
+    global _table_names
+    with _lock:
+        _table_names = None
+        names = [name] if name is not None else list(_tables)
+        for table_name in names:
+            table = _tables.pop(table_name, None)
+            if table is not None:
+                _metadata.remove(table)
@@ -6,185 +6,90 @@ function getRandomColor() {
     return `rgba(${r}, ${g}, ${b}, 0.6)`;
 }
 
-// === Monthly Trends Chart (Line Chart) ===
-// Endpoint: /charts/api/monthly_trends
-// Canvas ID: Monthlytrends
-fetch('/charts/api/monthly_trends')
-.then(response => response.json())
-.then(data => {
-    const ctx = document.getElementById('Monthlytrends').getContext('2d');
-    const backgroundColors = data.labels.map(() => getRandomColor());
-    new Chart(ctx, {
-        type: 'line',
-        data: {
-            labels: data.labels,
-            datasets: [{
-                label: 'Monthly trends',
-                data: data.data,
-                backgroundColor: backgroundColors,
-                fill: true,
-                tension: 0.4
-            }]
-        },
-        options: {
-            responsive: true
-        }
-    });
-});
+// Axis title helper shared by the bar charts
+function axisTitle(text) {
+    return {
+        display: true,
+        text: text,
+        color: 'blue',
+        font: { size: 14, weight: 'bold' }
+    };
+}
 
-// === Transaction Distribution Chart (Pie Chart) ===
-// Endpoint: /charts/api/transaction_distribution
-// Canvas ID: Tra
-fetch('/charts/api/transaction_distribution')
-.then(response => response.json())
-.then(data => {
-    const ctx = document.getElementById('Tra').getContext('2d');
-    const backgroundColors = data.labels.map(() => getRandomColor());
-    new Chart(ctx, {
-        type: 'pie',
+// Draws one chart if its canvas exists on the current page
+function renderChart(canvasId, type, label, series, extra = {}) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas || !series) {
+        return;
+    }
+    const backgroundColors = series.labels.map(() => getRandomColor());
+    new Chart(canvas.getContext('2d'), {
+        type: type,
         data: {
-            labels: data.labels,
+            labels: series.labels,
             datasets: [{
-                label: 'Transaction Distribution',
-                data: data.data,
+                label: label,
+                data: series.data,
                 backgroundColor: backgroundColors,
+                ...(extra.dataset || {})
             }]
         },
         options: {
             responsive: true,
+            ...(extra.options || {})
         }
     });
-});
+}
 
-// === Transaction Volume by Type Chart (Bar Chart) ===
-// Endpoint: /charts/api/volume_type (Corrected from previous version)
-// Canvas ID: Totaltransactionvolumebytype
-fetch('/charts/api/volume_type')
+// All chart series come from a single request
+// Endpoint: /charts/api/summary
+fetch('/charts/api/summary')
 .then(response => response.json())
-.then(data => {
-    const ctx = document.getElementById('Totaltransactionvolumebytype').getContext('2d');
-    const backgroundColors = data.labels.map(() => getRandomColor());
-    new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: data.labels,
-            datasets: [{
-                label: 'Transaction Volume by Type',
-                data: data.data,
-                backgroundColor: backgroundColors,
-                fill: true,
-                tension: 0.4
-            }]
-        },
+.then(summary => {
+    // === Monthly Trends Chart (Line Chart) ===
+    // Canvas ID: Monthlytrends
+    renderChart('Monthlytrends', 'line', 'Monthly trends', summary.monthly_trends, {
+        dataset: { fill: true, tension: 0.4 }
+    });
+
+    // === Transaction Distribution Chart (Pie Chart) ===
+    // Canvas ID: Tra
+    renderChart('Tra', 'pie', 'Transaction Distribution', summary.transaction_distribution);
+
+    // === Transaction Volume by Type Chart (Bar Chart) ===
+    // Canvas ID: Totaltransactionvolumebytype
+    renderChart('Totaltransactionvolumebytype', 'bar', 'Transaction Volume by Type', summary.volume_type, {
+        dataset: { fill: true, tension: 0.4 },
         options: {
-            responsive: true,
             scales: {
-                x: {
-                    title: {
-                        display: true,
-                        text: 'Type',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                },
-                y: {
-                    title: {
-                        display: true,
-                        text: 'Number of transactions',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                }
+                x: { title: axisTitle('Type') },
+                y: { title: axisTitle('Number of transactions') }
             }
         }
     });
-});
 
-// === Transaction Amount by Type Chart (Bar Chart) ===
-// Endpoint: /charts/api/amount_type (Corrected from previous version)
-// Canvas ID: TransactionAmountbyType
-fetch('/charts/api/amount_type')
-.then(response => response.json())
-.then(data => {
-    const ctx = document.getElementById('TransactionAmountbyType').getContext('2d');
-    const backgroundColors = data.labels.map(() => getRandomColor());
-    new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: data.labels,
-            datasets: [{
-                label: 'Transaction Amount by Type',
-                data: data.data,
-                backgroundColor: backgroundColors,
-                fill: true,
-                tension: 0.4
-            }]
-        },
+    // === Transaction Amount by Type Chart (Bar Chart) ===
+    // Canvas ID: TransactionAmountbyType
+    renderChart('TransactionAmountbyType', 'bar', 'Transaction Amount by Type', summary.amount_type, {
+        dataset: { fill: true, tension: 0.4 },
         options: {
-            responsive: true,
             scales: {
-                x: {
-                    title: {
-                        display: true,
-                        text: 'Type',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                },
-                y: {
-                    title: {
-                        display: true,
-                        text: 'Amount',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                }
+                x: { title: axisTitle('Type') },
+                y: { title: axisTitle('Amount') }
             }
         }
     });
-});
 
-// === Average Transaction Amount Chart (Bar Chart) ===
-// Endpoint: /charts/api/transaction_amount
-// Canvas ID: AverageTransactionAmount
-fetch('/charts/api/transaction_amount')
-.then(response => response.json())
-.then(data => {
-    const ctx = document.getElementById('AverageTransactionAmount').getContext('2d');
-    const backgroundColors = data.labels.map(() => getRandomColor());
-    new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: data.labels,
-            datasets: [{
-                label: 'Average Transaction Amount',
-                data: data.data,
-                backgroundColor: backgroundColors,
-                fill: true,
-                tension: 0.4
-            }]
-        },
+    // === Average Transaction Amount Chart (Bar Chart) ===
+    // Canvas ID: AverageTransactionAmount
+    renderChart('AverageTransactionAmount', 'bar', 'Average Transaction Amount', summary.transaction_amount, {
+        dataset: { fill: true, tension: 0.4 },
         options: {
-            responsive: true,
             indexAxis: 'y', // Renders the bar chart horizontally
             scales: {
-                x: {
-                    title: {
-                        display: true,
-                        text: 'Average amount',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                },
-                y: {
-                    title: {
-                        display: true,
-                        text: 'Type',
-                        color: 'blue',
-                        font: { size: 14, weight: 'bold' }
-                    }
-                }
+                x: { title: axisTitle('Average amount') },
+                y: { title: axisTitle('Type') }
             }
         }
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,71 @@
+import os
+from sqlalchemy import literal
+
+from . import schema_cache
+
+# Where transactions live:
+#   split   - one table per parser category (the original layout)
+#   unified - one `transactions` table with a `category` column, indexed by user_id
+# Switch to unified after running `flask --app App migrate-unified`.
+STORAGE_MODE = os.getenv("TRANSACTION_STORAGE", "split").lower()
+UNIFIED_TABLE = 'transactions'
+# Per (user_id, category, month) aggregates maintained by ingest
+ROLLUP_TABLE = 'transaction_rollups'
+
+# List all your transaction tables (sanitized names)
+TRANSACTION_TABLES = [
+    'bank_transfers',
+    'withdrawals_from_agents',
+    'transactions_initiated_by_third_parties',
+    'bundle_purchases',
+    'cash_power_bill_payments',
+    'airtime_bill_payments',
+    'bank_deposits',
+    'transfers_to_mobile_numbers',
+    'payments_to_code_holders',
+    'incoming_money'
+]
+
+def is_unified():
+    return STORAGE_MODE == 'unified'
+
+def user_filter(table, user_id):
+    """WHERE clause selecting user_id's rows (or the user_id IS NULL sample rows)."""
+    if "user_id" not in table.c:
+        return None
+    if user_id is not None:
+        return table.c.user_id == user_id
+    return table.c.user_id.is_(None)
+
+def transaction_sources(categories=None, columns=()):
+    """
+    The places to read transactions from, as (table, category, conditions) tuples:
+    table is the reflected Table, category a column or literal naming the category
+    of each row and conditions the predicates that keep the read within
+    `categories` (all TRANSACTION_TABLES by default). Tables lacking any of
+    `columns` are skipped.
+
+    In split mode there is one entry per existing category table; in unified mode
+    a single entry covers every category.
+    """
+    if categories is None:
+        categories = TRANSACTION_TABLES
+    else:
+        categories = [name for name in TRANSACTION_TABLES if name in categories]
+    if not categories:
+        return []
+
+    if is_unified():
+        table = schema_cache.get_table(UNIFIED_TABLE)
+        if table is None or any(column not in table.c for column in columns):
+            return []
+        # Always restrict: the unified table also holds unprocessed_data rows
+        return [(table, table.c.category, [table.c.category.in_(categories)])]
+
+    sources = []
+    for name in categories:
+        table = schema_cache.get_table(name)
+        if table is None or any(column not in table.c for column in columns):
+            continue
+        sources.append((table, literal(name), []))
+    return sources
@@ -1,7 +1,6 @@
 from flask import Blueprint, request, g, redirect, url_for, flash
 from werkzeug.utils import secure_filename
-from .manage_db import inserting_in_database
-from .parser import parser # The new parser
+from .jobs import submit_upload, job_status, describe_job
 from .middleware import login_required
 
 # Create a Blueprint for this functionality
@@ -32,14 +31,10 @@ def upload_file():
             try:
                 user_id = g.user_id
                 
-                # Pass the FileStorage object directly to the parser
-                parsed_data = parser(file)
-                
-                if parsed_data:
-                    inserting_in_database(parsed_data, user_id)
-                    flash('File uploaded and data processed successfully!', 'success')
-                else:
-                    flash('Failed to process the XML file. Please check its format.', 'danger')
+                # Spool the file; an ingest worker parses and inserts it
+                job_id = submit_upload(file, user_id)
+                status = job_status(job_id, user_id)
+                flash(describe_job(status), 'danger' if status['status'] == 'failed' else 'success')
             except Exception as e:
                 flash(f'An unexpected error occurred: {e}', 'danger')
         else:
@@ -1,5 +1,5 @@
 from werkzeug.security import check_password_hash, generate_password_hash
-from sqlalchemy import String, Column, Integer
+from sqlalchemy import String, Column, Integer, DateTime
 from .database import Base
 
 
@@ -15,5 +15,27 @@ class User(Base):
         return check_password_hash(self.hash_password, entered_password)
 
 
+class UserDataStats(Base):
+    """Per-user record of uploaded data, maintained by ingest."""
+    __tablename__ = 'user_data_stats'
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    row_count = Column(Integer, nullable=False, default=0)
+    upload_count = Column(Integer, nullable=False, default=0)
+    # UTC; sent as the Last-Modified header of data views
+    last_upload_at = Column(DateTime)
 
 
+class IngestJob(Base):
+    """A spooled upload handed to the ingestion workers, with its progress."""
+    __tablename__ = 'ingest_jobs'
+    id = Column(String(36), primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    filename = Column(String(255))
+    status = Column(String(16), nullable=False, default='queued')
+    parsed = Column(Integer, nullable=False, default=0)
+    inserted = Column(Integer, nullable=False, default=0)
+    error = Column(String(1024))
+    created_at = Column(DateTime)
+    # Last progress report, used to spot jobs whose worker went away
+    updated_at = Column(DateTime)
+    finished_at = Column(DateTime)
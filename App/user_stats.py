@@ -0,0 +1,154 @@
+import os
+from sqlalchemy import insert, update, select, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from .cache import TTLCache, MISSING
+from . import aggregate_cache, storage
+from .database import get_db
+from .user_model import UserDataStats
+
+# Per-user "has data / row count / last upload" index. Ingest keeps the
+# user_data_stats table up to date; lookups are served from an in-process cache
+# that ingest invalidates locally and that expires after USER_STATS_TTL seconds
+# so uploads handled by other workers are seen.
+USER_STATS_TTL = int(os.getenv("USER_STATS_TTL", "60"))
+
+_stats_cache = TTLCache(ttl=USER_STATS_TTL, maxsize=10000)
+
+def _as_dict(stats):
+    return {
+        'has_data': stats.row_count > 0,
+        'row_count': stats.row_count,
+        'upload_count': stats.upload_count,
+        'last_upload_at': stats.last_upload_at,
+    }
+
+def get_user_stats(user_id):
+    """Cached stats dict for user_id, or None if the user has no record yet."""
+    stats = _stats_cache.get(user_id)
+    if stats is not MISSING:
+        return stats
+
+    with get_db() as session:
+        record = session.get(UserDataStats, user_id)
+        stats = _as_dict(record) if record is not None else None
+    _stats_cache.set(user_id, stats)
+    return stats
+
+def user_version(user_id):
+    """
+    Version of user_id's data, "<uploads>:<rows>", or None without a record. Every
+    chunk of an upload moves it, in the same transaction as the rows themselves.
+    """
+    stats = get_user_stats(user_id)
+    if stats is None:
+        return None
+    return f"{stats['upload_count']}:{stats['row_count']}"
+
+def data_version(user_id):
+    """
+    (version, last_modified) of the data user_id is shown, for HTTP validators.
+    version changes with every upload that adds rows; users without data see the
+    sample data and get the digest of its cached chart aggregates. None if the
+    user has no record yet, or the sample aggregates are not cached (or are due
+    for a refresh), in which case the view runs and recomputes them.
+    """
+    stats = get_user_stats(user_id) if user_id is not None else None
+    if user_id is not None and stats is None:
+        return None
+    if stats and stats['has_data']:
+        return f"user:{user_id}:{user_version(user_id)}", stats['last_upload_at']
+    sample = aggregate_cache.sample_version(("charts", ()))
+    if sample is None:
+        return None
+    return f"sample:{sample}", None
+
+def _apply(user_id, rows, uploads, uploaded_at):
+    with get_db() as session:
+        record = session.get(UserDataStats, user_id)
+        if record is None:
+            session.add(UserDataStats(
+                user_id=user_id,
+                row_count=rows,
+                upload_count=uploads,
+                last_upload_at=uploaded_at,
+            ))
+        else:
+            record.row_count = UserDataStats.row_count + rows
+            record.upload_count = UserDataStats.upload_count + uploads
+            if uploaded_at is not None:
+                record.last_upload_at = uploaded_at
+        session.commit()
+
+def _stored_row_count(conn, user_id):
+    total = 0
+    for table, _, conditions in storage.transaction_sources(columns=("user_id",)):
+        total += conn.execute(
+            select(func.count()).select_from(table).where(table.c.user_id == user_id, *conditions)
+        ).scalar() or 0
+    return total
+
+def ensure_record(conn, user_id):
+    """
+    Give user_id a record on conn if they have none, counting the transactions
+    they stored before the index existed (as the dashboard's backfill does).
+    Ingest calls it before inserting a chunk, in the same transaction, so the
+    record then only grows by what that chunk adds. Without this a first upload
+    would create a record holding just its own rows, and the rollups, which hold
+    the same number, would pass for complete while the older rows are missing.
+    """
+    table = UserDataStats.__table__
+    if conn.execute(select(table.c.user_id).where(table.c.user_id == user_id)).first() is not None:
+        return
+    values = {'user_id': user_id, 'row_count': _stored_row_count(conn, user_id), 'upload_count': 0}
+    # A concurrent upload may create it first; its count already covers the old rows
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(values)
+        conn.execute(stmt.on_duplicate_key_update(user_id=stmt.inserted.user_id))
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table).values(values)
+        conn.execute(stmt.on_conflict_do_nothing(index_elements=['user_id']))
+    else:
+        conn.execute(insert(table).values(values))
+
+def add_upload_rows(conn, user_id, rows, uploads, uploaded_at):
+    """
+    Add rows (and uploads) to user_id's record on conn, inside the caller's
+    transaction, so the record always agrees with the rows that transaction
+    commits. Callers invalidate() once it has committed.
+    """
+    table = UserDataStats.__table__
+    values = {'user_id': user_id, 'row_count': rows, 'upload_count': uploads, 'last_upload_at': uploaded_at}
+    merged = {
+        'row_count': table.c.row_count + rows,
+        'upload_count': table.c.upload_count + uploads,
+        'last_upload_at': uploaded_at,
+    }
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        conn.execute(mysql.insert(table).values(values).on_duplicate_key_update(merged))
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table).values(values)
+        conn.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_=merged))
+    else:
+        result = conn.execute(update(table).where(table.c.user_id == user_id).values(merged))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(values))
+
+def backfill_user_stats(user_id, row_count):
+    """Create the record for a user whose data predates the index."""
+    try:
+        _apply(user_id, row_count, 0, None)
+    except IntegrityError:
+        pass
+    invalidate(user_id)
+    return get_user_stats(user_id)
+
+def invalidate(user_id=None):
+    """Drop the cached stats for one user, or for everyone."""
+    if user_id is None:
+        _stats_cache.clear()
+    else:
+        _stats_cache.delete(user_id)